@@ -0,0 +1,70 @@
+"""
+Benchmark of the CRIq working activity step: the previous per-participant
+iloc/idxmax/idxmin loop against the vectorized score_CRIq._working_activity.
+Checks both give identical scores and prints wall time for each.
+
+Usage: python benchmarks/bench_CRIq_working.py --n 150000
+"""
+import argparse
+import os
+import sys
+import time
+
+import numpy as np
+import pandas as pd
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                                os.pardir))
+from score_CRIq import _working_activity
+
+
+def make_working_scores(n, seed=0):
+    """ Working activity scores (years rounded up to 5 * job level), with
+    roughly half of the entries missing (NaN). """
+    rng = np.random.default_rng(seed)
+    years = np.ceil(rng.integers(0, 40, (n, 5)) / 5) * 5
+    work = years * np.arange(1, 6)
+    work[(rng.random((n, 5)) < 0.5) | (work == 0)] = np.nan
+    return work
+
+
+def loop_working_activity(work):
+    """ Working activity step as previously implemented in score_CRIq. """
+    work = pd.DataFrame(work)
+    max_working = work.max(axis=1)
+    max_ix = work.fillna(-np.inf).idxmax(axis=1)
+    avg_working = pd.Series(index=max_working.index, dtype=float)
+
+    for row in range(len(max_ix)):
+        all_work = work.iloc[row, :].copy()
+        all_work[max_ix.iloc[row]] = np.nan
+        if all_work.count() >= 3:
+            all_work[all_work.idxmin()] = np.nan
+        avg_working[row] = all_work.mean()
+
+    avg_working = avg_working.fillna(0)
+    return max_working.to_numpy(), avg_working.to_numpy()
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--n', type=int, default=150000)
+    args = parser.parse_args()
+
+    work = make_working_scores(args.n)
+
+    start = time.perf_counter()
+    loop_max, loop_avg = loop_working_activity(work)
+    loop_time = time.perf_counter() - start
+
+    start = time.perf_counter()
+    max_working, avg_working = _working_activity(work)
+    vector_time = time.perf_counter() - start
+
+    assert np.array_equal(loop_max, max_working, equal_nan=True)
+    assert np.array_equal(loop_avg, avg_working)
+
+    print('participants: %d' % args.n)
+    print('loop:       %.3f s' % loop_time)
+    print('vectorized: %.3f s (%.0fx faster)'
+          % (vector_time, loop_time / vector_time))
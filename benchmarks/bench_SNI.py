@@ -0,0 +1,105 @@
+"""
+Benchmark of score_SNI_Cohen on synthetic respondents (default 1M) against
+the previous sub-dataframe implementation (kept below as
+previous_score_SNI_Cohen). Checks both give the same scores and prints wall
+time for each.
+
+Usage: python benchmarks/bench_SNI.py --n 1000000
+"""
+import argparse
+import os
+import sys
+import time
+import warnings
+
+import numpy as np
+import pandas as pd
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                                os.pardir))
+from score_SNI_Cohen import score_SNI_Cohen
+from synthetic import make_SNI
+
+
+def previous_score_SNI_Cohen(df):
+    """ score_SNI_Cohen as previously implemented. """
+    spouse = df['SNI_1']
+    spouse = spouse.where(spouse==1)
+    spouse = spouse.replace(np.nan, 0)
+    net_div = df[['SNI_2a', 'SNI_3a', 'SNI_4a', 'SNI_5a', 'SNI_6a', 'SNI_7a',
+                  'SNI_8a', 'SNI_9a', 'SNI_9b', 'SNI_10', 'SNI_11', 'SNI_12']]
+    net_div = net_div.replace(np.nan, 0)
+    net_div[net_div != 0] = 1
+    employee = net_div[['SNI_9a', 'SNI_9b']].sum(axis=1)
+    employee = employee.replace(1, 0)
+    net_div = net_div.drop(['SNI_9a', 'SNI_9b'], axis=1)
+    net_div['SNI_1'] = spouse
+    net_div['SNI_9'] = employee
+    num_high_contact = net_div.sum(axis=1)
+
+    num_people = df[['SNI_2a', 'SNI_5a', 'SNI_6a', 'SNI_7a', 'SNI_8a', 'SNI_9a',
+                     'SNI_9b', 'SNI_10', 'SNI_11a', 'SNI_12a_number',
+                     'SNI_12b_number', 'SNI_12c_number', 'SNI_12d_number',
+                     'SNI_12e_number', 'SNI_12f_number']].copy()
+    num_people['SNI_1'] = spouse
+    parents_inlaws = df[['SNI_3a', 'SNI_4a']].replace([1, 2, 3], [1, 1, 2])
+    num_people[['SNI_3a', 'SNI_4a']] = parents_inlaws[['SNI_3a', 'SNI_4a']]
+    num_people = num_people.replace(np.nan, 0).sum(axis=1)
+
+    ntwrks = df[['SNI_6a', 'SNI_7a', 'SNI_8a', 'SNI_10', 'SNI_11a']].copy()
+    ntwrks[ntwrks < 4] = 0
+    ntwrks[ntwrks >= 4] = 1
+    work_ntwrk = df[['SNI_9a', 'SNI_9b']].sum(axis=1)
+    work_ntwrk[work_ntwrk < 4] = 0
+    work_ntwrk[work_ntwrk >= 4] = 1
+    ntwrks['SNI_9'] = work_ntwrk
+    groups_ntwrk = df[['SNI_12a_number', 'SNI_12b_number', 'SNI_12c_number',
+                       'SNI_12d_number', 'SNI_12e_number',
+                       'SNI_12f_number']].sum(axis=1)
+    groups_ntwrk[groups_ntwrk < 4] = 0
+    groups_ntwrk[groups_ntwrk >= 4] = 1
+    ntwrks['SNI_12'] = groups_ntwrk
+    family_roles = df[['SNI_2a', 'SNI_3a', 'SNI_4a', 'SNI_5a']].copy()
+    family_roles['SNI_1'] = spouse
+    family_roles = family_roles.replace(0, np.nan).count(axis=1).astype(float)
+    family_roles[family_roles < 3] = 0
+    family_roles[family_roles >= 3] = 0.5
+    family_members = df[['SNI_2a', 'SNI_3a', 'SNI_4a', 'SNI_5a']].copy()
+    family_members['SNI_1'] = spouse
+    family_members = family_members.sum(axis=1)
+    family_members[family_members < 4] = 0
+    family_members[family_members >= 4] = 0.5
+    family_ntwrk = (family_roles + family_members).replace(0.5, 0)
+    ntwrks['family'] = family_ntwrk
+    num_ntwrks = ntwrks.replace(np.nan, 0).sum(axis=1)
+
+    sni_scored = pd.DataFrame(index=df.index)
+    sni_scored['SNI_Roles'] = num_high_contact
+    sni_scored['SNI_People'] = num_people
+    sni_scored['SNI_Networks'] = num_ntwrks
+    return sni_scored.reset_index()
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--n', type=int, default=1000000)
+    args = parser.parse_args()
+
+    data = make_SNI(args.n)
+
+    with warnings.catch_warnings():
+        warnings.simplefilter('ignore')
+        start = time.perf_counter()
+        expected = previous_score_SNI_Cohen(data)
+        previous_time = time.perf_counter() - start
+
+    start = time.perf_counter()
+    scored = score_SNI_Cohen(data)
+    new_time = time.perf_counter() - start
+
+    pd.testing.assert_frame_equal(expected, scored)
+
+    print('respondents: %d' % args.n)
+    print('previous: %.3f s' % previous_time)
+    print('numpy:    %.3f s (%.1fx faster)'
+          % (new_time, previous_time / new_time))
@@ -0,0 +1,44 @@
+"""
+Benchmark of create_unique_combinations_parallel scaling with the number of
+worker processes. Prints wall time and speed-up over a single worker.
+
+Usage: python benchmarks/bench_composites_parallel.py --n 20000 --k 14 --workers 1 2 4 8
+"""
+import argparse
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                                os.pardir))
+from create_cogRes_composites import (create_unique_combinations,
+                                      create_unique_combinations_parallel)
+from synthetic import make_proxies
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--n', type=int, default=20000)
+    parser.add_argument('--k', type=int, default=14)
+    parser.add_argument('--workers', type=int, nargs='+',
+                        default=[1, 2, 4, 8])
+    parser.add_argument('--subsets-per-task', type=int, default=1024)
+    args = parser.parse_args()
+
+    df = make_proxies(args.n, args.k)
+
+    start = time.perf_counter()
+    create_unique_combinations(df)
+    serial = time.perf_counter() - start
+    print('serial create_unique_combinations: %.2f s' % serial)
+
+    baseline = None
+    for n_workers in args.workers:
+        start = time.perf_counter()
+        create_unique_combinations_parallel(
+                df, n_workers=n_workers,
+                subsets_per_task=args.subsets_per_task)
+        elapsed = time.perf_counter() - start
+        baseline = baseline or elapsed
+        print('%3d workers: %.2f s (speed-up %.2fx)'
+              % (n_workers, elapsed, baseline / elapsed))
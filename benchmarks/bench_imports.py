@@ -0,0 +1,57 @@
+"""
+Benchmark of module startup: import time of each module of the repo in a
+fresh interpreter (median of --repeat runs), with the time of importing
+numpy and pandas alone as a baseline. Also reports whether an import pulled
+in plotting libraries (matplotlib/seaborn), which the scoring modules and
+pool workers should never load.
+
+Usage: python benchmarks/bench_imports.py --repeat 5
+"""
+import argparse
+import os
+import subprocess
+import sys
+
+ROOT = os.path.abspath(os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                                    os.pardir))
+
+MODULES = ['scoring_utils', 'instrumentation', 'score_CRIq',
+           'score_IPAQ_short', 'score_CSAQ_frequency', 'score_SNI_Cohen',
+           'score_wave', 'score_cache', 'score_files',
+           'create_cogRes_composites', 'partitioned', 'make_interaction_plot']
+
+# run in the child interpreter - prints import seconds and plotting flag
+_CHILD = '''
+import sys, time
+start = time.perf_counter()
+%s
+elapsed = time.perf_counter() - start
+print(elapsed, int('matplotlib' in sys.modules or 'seaborn' in sys.modules))
+'''
+
+
+def time_import(statement, repeat=5):
+    """ Median wall time (s) of running an import statement in a fresh
+    interpreter, and whether it loaded matplotlib or seaborn. """
+    times = []
+    for _ in range(repeat):
+        out = subprocess.run([sys.executable, '-c', _CHILD % statement],
+                             cwd=ROOT, capture_output=True, text=True,
+                             check=True).stdout.split()
+        times.append(float(out[0]))
+    return sorted(times)[len(times) // 2], bool(int(out[1]))
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--repeat', type=int, default=5)
+    parser.add_argument('--modules', nargs='+', default=MODULES)
+    args = parser.parse_args()
+
+    baseline, _ = time_import('import numpy, pandas', args.repeat)
+    print('%-28s %8.1f ms' % ('numpy + pandas', baseline * 1000))
+    for module in args.modules:
+        elapsed, plotting = time_import('import ' + module, args.repeat)
+        print('%-28s %8.1f ms (+%6.1f ms)%s'
+              % (module, elapsed * 1000, (elapsed - baseline) * 1000,
+                 '  loads plotting libraries' if plotting else ''))
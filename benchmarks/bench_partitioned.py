@@ -0,0 +1,113 @@
+"""
+Benchmark of the out-of-core backend (partitioned.py) on a synthetic cohort
+written as a partitioned Parquet dataset. Scores IPAQ and CRIq and writes
+composites partition by partition in a local process pool, checks the
+results against scoring the whole cohort in memory and prints wall time.
+If dask.distributed is installed, the scorers and composites are run again on
+a LocalCluster of worker processes.
+
+Usage: python benchmarks/bench_partitioned.py --n 1000000 --files 8 --workers 4
+"""
+import argparse
+import os
+import sys
+import tempfile
+import time
+
+import numpy as np
+import pandas as pd
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                                os.pardir))
+from create_cogRes_composites import (create_unique_combinations,
+                                      reference_stats, standardise)
+from partitioned import (iter_partitions, score_partitioned,
+                         write_composites_partitioned)
+from scoring_utils import score_frame
+from synthetic import make_CRIq, make_IPAQ, make_proxies
+
+
+def write_dataset(data, folder, n_files):
+    """ Writes data as n_files Parquet files of consecutive rows. The
+    index is not written (subject ids must be a column), as dask cannot read
+    a RangeIndex stored as Parquet metadata. """
+    os.makedirs(folder)
+    for i, part in enumerate(np.array_split(np.arange(len(data)), n_files)):
+        data.iloc[part].to_parquet(
+                os.path.join(folder, 'part-%05d.parquet' % i), index=False)
+
+
+def check(expected, out_dir):
+    """ Compares the partitioned output with the in-memory result. """
+    scored = pd.read_parquet(out_dir)
+    pd.testing.assert_frame_equal(expected.reset_index(drop=True),
+                                  scored.reset_index(drop=True),
+                                  check_dtype=False)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--n', type=int, default=1000000)
+    parser.add_argument('--files', type=int, default=8)
+    parser.add_argument('--workers', type=int, default=4)
+    parser.add_argument('--batch-rows', type=int, default=None)
+    parser.add_argument('--k', type=int, default=8)
+    args = parser.parse_args()
+
+    tmp = tempfile.mkdtemp()
+    cohorts = {'IPAQ': make_IPAQ(args.n), 'CRIq': make_CRIq(args.n)}
+    proxies = make_proxies(args.n, args.k)
+    for name, data in cohorts.items():
+        write_dataset(data, os.path.join(tmp, name), args.files)
+    write_dataset(proxies.reset_index(), os.path.join(tmp, 'proxies'),
+                  args.files)
+    print('participants: %d in %d files' % (args.n, args.files))
+
+    for name, data in cohorts.items():
+        expected = score_frame(data, name)
+        start = time.perf_counter()
+        score_partitioned(name, os.path.join(tmp, name),
+                          os.path.join(tmp, name + '_scored'),
+                          n_workers=args.workers, batch_rows=args.batch_rows,
+                          verbose=False)
+        print('%-10s %d workers: %.2f s' % (name, args.workers,
+                                            time.perf_counter() - start))
+        check(expected, os.path.join(tmp, name + '_scored'))
+
+    start = time.perf_counter()
+    stats = reference_stats(iter_partitions(os.path.join(tmp, 'proxies'),
+                                            batch_rows=args.batch_rows,
+                                            index_col='subid'))
+    write_composites_partitioned(os.path.join(tmp, 'proxies'),
+                                 os.path.join(tmp, 'composites'), stats=stats,
+                                 index_col='subid', n_workers=args.workers,
+                                 batch_rows=args.batch_rows, verbose=False)
+    print('composites k=%d %d workers: %.2f s'
+          % (args.k, args.workers, time.perf_counter() - start))
+    expected = create_unique_combinations(standardise(proxies, stats))
+    check(expected.reset_index(), os.path.join(tmp, 'composites'))
+
+    try:
+        import dask.dataframe as dd
+        from dask.distributed import Client, LocalCluster
+    except ImportError:
+        print('dask.distributed not installed - skipping LocalCluster run')
+        sys.exit()
+
+    with LocalCluster(n_workers=args.workers, processes=True,
+                      threads_per_worker=1) as cluster, Client(cluster):
+        for name, data in cohorts.items():
+            ddf = dd.read_parquet(os.path.join(tmp, name))
+            start = time.perf_counter()
+            score_partitioned(name, ddf, os.path.join(tmp, name + '_dask'))
+            print('%-10s dask, %d workers: %.2f s'
+                  % (name, args.workers, time.perf_counter() - start))
+            check(score_frame(data, name), os.path.join(tmp, name + '_dask'))
+
+        ddf = dd.read_parquet(os.path.join(tmp, 'proxies'), index='subid')
+        start = time.perf_counter()
+        write_composites_partitioned(ddf, os.path.join(tmp, 'composites_dask'),
+                                     stats=stats)
+        print('composites k=%d dask, %d workers: %.2f s'
+              % (args.k, args.workers, time.perf_counter() - start))
+        check(expected, os.path.join(tmp, 'composites_dask'))
@@ -0,0 +1,54 @@
+"""
+Micro-benchmark of rounding CRIq years columns up to the nearest 5: the
+previous per-cell applymap(roundup) against scoring_utils.ceil_to_multiple
+applied in place to the whole numpy block.
+
+Usage: python benchmarks/bench_rounding.py --n 100000
+"""
+import argparse
+import math
+import os
+import sys
+import time
+
+import numpy as np
+import pandas as pd
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                                os.pardir))
+from scoring_utils import ceil_to_multiple
+
+
+def roundup(x):
+    """ Per-cell rounding as previously used in score_CRIq. """
+    return int(math.ceil(x / 5)) * 5
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--n', type=int, default=100000)
+    parser.add_argument('--cols', type=int, default=21,
+                        help='5 working + 16 leisure years columns')
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(0)
+    years = pd.DataFrame(rng.integers(0, 60, (args.n, args.cols)),
+                         dtype=np.float64)
+
+    # DataFrame.applymap was renamed DataFrame.map in pandas 2.1
+    cellwise = getattr(years, 'map', None) or years.applymap
+    start = time.perf_counter()
+    expected = cellwise(roundup)
+    cell_time = time.perf_counter() - start
+
+    block = years.to_numpy(copy=True)
+    start = time.perf_counter()
+    ceil_to_multiple(block, 5, out=block)
+    block_time = time.perf_counter() - start
+
+    assert np.array_equal(expected.to_numpy(dtype=np.float64), block)
+
+    print('cells: %d x %d' % (args.n, args.cols))
+    print('applymap(roundup): %.3f s' % cell_time)
+    print('ceil_to_multiple:  %.4f s (%.0fx faster)'
+          % (block_time, cell_time / block_time))
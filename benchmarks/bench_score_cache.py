@@ -0,0 +1,71 @@
+"""
+Benchmark of score_cache.score_cached on synthetic participants (default
+1M): a cold call that scores everyone into an empty cache, then a warm call
+after changing the last item of --changed participants, against scoring the
+full data again without the cache. Checks the warm call gives the same
+scores (and dtypes) as the full rescore and prints wall time for each.
+
+Usage: python benchmarks/bench_score_cache.py --n 1000000 --changed 5000 -q IPAQ
+"""
+import argparse
+import os
+import shutil
+import sys
+import tempfile
+import time
+
+import numpy as np
+import pandas as pd
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                                os.pardir))
+from score_cache import _SCORERS, score_cached
+import synthetic
+
+MAKE = {'CRIq': synthetic.make_CRIq, 'IPAQ': synthetic.make_IPAQ,
+        'CSAQ': synthetic.make_CSAQ, 'SNI': synthetic.make_SNI}
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--n', type=int, default=1000000)
+    parser.add_argument('--changed', type=int, default=5000)
+    parser.add_argument('--questionnaire', '-q', default='IPAQ',
+                        choices=sorted(MAKE))
+    args = parser.parse_args()
+
+    data = MAKE[args.questionnaire](args.n)
+    cache_path = tempfile.mkdtemp()
+    try:
+        start = time.perf_counter()
+        score_cached(args.questionnaire, data, cache_path)
+        cold_time = time.perf_counter() - start
+
+        # change the last item of some participants
+        rng = np.random.default_rng(1)
+        rows = rng.choice(args.n, args.changed, replace=False)
+        data = data.copy()
+        data.iloc[rows, -1] = data.iloc[rows, -1].fillna(0) + 1
+
+        start = time.perf_counter()
+        cached = score_cached(args.questionnaire, data, cache_path)
+        warm_time = time.perf_counter() - start
+    finally:
+        shutil.rmtree(cache_path)
+
+    _, score, _, subid_column = _SCORERS[args.questionnaire]
+    start = time.perf_counter()
+    expected = score(data)
+    full_time = time.perf_counter() - start
+
+    if subid_column:
+        expected = expected.iloc[:, 1:]
+    expected.index = cached.index
+    pd.testing.assert_frame_equal(expected, cached)
+
+    print('%s participants: %d, changed: %d'
+          % (args.questionnaire, args.n, args.changed))
+    print('cold cache:   %.3f s' % cold_time)
+    print('warm cache:   %.3f s' % warm_time)
+    print('full rescore: %.3f s (warm cache %.1fx faster)'
+          % (full_time, full_time / warm_time))
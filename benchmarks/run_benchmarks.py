@@ -0,0 +1,181 @@
+"""
+Reproducible benchmark suite. Times every scorer on seeded synthetic
+participants (default 1k, 100k and 1M) and create_unique_combinations for
+k = 5 to 20 proxies. Each case runs in a fresh subprocess so that its peak
+RSS is measured alone. Wall time, peak RSS and rows/s are written to a JSON
+file together with the commit and library versions, so results can be
+compared between commits with --compare.
+
+Composite cases whose output (n x (2^k - 1) float64 values) would exceed
+--max-composite-gb are recorded as skipped.
+
+Usage: python benchmarks/run_benchmarks.py --out bench_results.json
+       python benchmarks/run_benchmarks.py --compare old.json new.json
+"""
+import argparse
+import json
+import os
+import platform
+import subprocess
+import sys
+import time
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+ROOT = os.path.join(HERE, os.pardir)
+sys.path.insert(0, ROOT)
+
+SCORERS = ('CRIq', 'IPAQ', 'CSAQ', 'SNI')
+
+
+def _peak_rss_mb():
+    """ Peak resident set size of this process in MB (None if the resource
+    module is unavailable, e.g. on Windows). """
+    try:
+        import resource
+    except ImportError:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # ru_maxrss is in bytes on macOS and in kilobytes elsewhere
+    return peak / 1024 ** 2 if sys.platform == 'darwin' else peak / 1024
+
+
+def run_case(case, n, k=None, seed=0):
+    """ Generate the synthetic data for one case, time the scorer on it and
+    return the measurements. Meant to be called in its own process. """
+    import synthetic
+    if case == 'CRIq':
+        from score_CRIq import score_CRIq as func
+        data = synthetic.make_CRIq(n, seed)
+    elif case == 'IPAQ':
+        from score_IPAQ_short import score_IPAQ_short as func
+        data = synthetic.make_IPAQ(n, seed)
+    elif case == 'CSAQ':
+        from score_CSAQ_frequency import score_CSAQ_frequency as func
+        data = synthetic.make_CSAQ(n, seed)
+    elif case == 'SNI':
+        from score_SNI_Cohen import score_SNI_Cohen as func
+        data = synthetic.make_SNI(n, seed)
+    elif case == 'composites':
+        from create_cogRes_composites import create_unique_combinations as func
+        data = synthetic.make_proxies(n, k, seed)
+    else:
+        raise ValueError('unknown benchmark case: %s' % case)
+
+    start = time.perf_counter()
+    func(data)
+    elapsed = time.perf_counter() - start
+    return {'case': case, 'n': n, 'k': k, 'seconds': elapsed,
+            'rows_per_s': n / elapsed, 'peak_rss_mb': _peak_rss_mb()}
+
+
+def _run_in_subprocess(case, n, k, seed):
+    """ Run one case in a fresh interpreter and return its measurements. """
+    cmd = [sys.executable, os.path.abspath(__file__), '--case', case,
+           '--n', str(n), '--seed', str(seed)]
+    if k is not None:
+        cmd += ['--k', str(k)]
+    proc = subprocess.run(cmd, capture_output=True, text=True)
+    if proc.returncode != 0:
+        return {'case': case, 'n': n, 'k': k,
+                'error': proc.stderr.strip().splitlines()[-1:]}
+    return json.loads(proc.stdout.strip().splitlines()[-1])
+
+
+def _environment():
+    """ Commit, interpreter and library versions the results belong to. """
+    import numpy as np
+    import pandas as pd
+    try:
+        commit = subprocess.run(['git', 'rev-parse', 'HEAD'], cwd=ROOT,
+                                capture_output=True, text=True).stdout.strip()
+    except OSError:
+        commit = None
+    return {'commit': commit or None,
+            'date': time.strftime('%Y-%m-%dT%H:%M:%S'),
+            'python': platform.python_version(),
+            'numpy': np.__version__, 'pandas': pd.__version__,
+            'platform': platform.platform(),
+            'cpu_count': os.cpu_count()}
+
+
+def _key(result):
+    return (result['case'], result['n'], result['k'])
+
+
+def compare(old_path, new_path):
+    """ Print the speed-up of each case in new_path over old_path. """
+    with open(old_path) as f:
+        old = json.load(f)
+    with open(new_path) as f:
+        new = json.load(f)
+    before = {_key(r): r for r in old['results'] if 'seconds' in r}
+    print('%s -> %s' % (old['environment']['commit'],
+                        new['environment']['commit']))
+    for result in new['results']:
+        if 'seconds' not in result or _key(result) not in before:
+            continue
+        prev = before[_key(result)]
+        label = result['case'] + ('' if result['k'] is None
+                                  else ' k=%d' % result['k'])
+        print('%-16s n=%-8d %8.3f s -> %8.3f s (%.2fx)'
+              % (label, result['n'], prev['seconds'], result['seconds'],
+                 prev['seconds'] / result['seconds']))
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(
+            description=__doc__,
+            formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--out', default='bench_results.json')
+    parser.add_argument('--sizes', type=int, nargs='+',
+                        default=[1000, 100000, 1000000])
+    parser.add_argument('--cases', nargs='+',
+                        default=list(SCORERS) + ['composites'])
+    parser.add_argument('--k-range', type=int, nargs=2, default=[5, 20],
+                        metavar=('MIN', 'MAX'))
+    parser.add_argument('--composite-n', type=int, default=1000)
+    parser.add_argument('--max-composite-gb', type=float, default=4.0)
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--compare', nargs=2, metavar=('OLD', 'NEW'))
+    # internal: run a single case and print its measurements as JSON
+    parser.add_argument('--case', help=argparse.SUPPRESS)
+    parser.add_argument('--n', type=int, help=argparse.SUPPRESS)
+    parser.add_argument('--k', type=int, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.compare:
+        compare(*args.compare)
+        sys.exit()
+
+    if args.case:
+        print(json.dumps(run_case(args.case, args.n, args.k, args.seed)))
+        sys.exit()
+
+    cases = [(case, n, None) for case in args.cases if case in SCORERS
+             for n in args.sizes]
+    if 'composites' in args.cases:
+        cases += [('composites', args.composite_n, k)
+                  for k in range(args.k_range[0], args.k_range[1] + 1)]
+
+    results = []
+    for case, n, k in cases:
+        label = case + ('' if k is None else ' k=%d' % k)
+        if k is not None and \
+                n * (2 ** k - 1) * 8 / 1024 ** 3 > args.max_composite_gb:
+            results.append({'case': case, 'n': n, 'k': k,
+                            'skipped': 'output exceeds --max-composite-gb'})
+            print('%-16s n=%-8d skipped' % (label, n))
+            continue
+        result = _run_in_subprocess(case, n, k, args.seed)
+        results.append(result)
+        if 'error' in result:
+            print('%-16s n=%-8d failed: %s' % (label, n, result['error']))
+        else:
+            print('%-16s n=%-8d %8.3f s %12.0f rows/s %9.1f MB peak RSS'
+                  % (label, n, result['seconds'], result['rows_per_s'],
+                     result['peak_rss_mb'] or float('nan')))
+
+    with open(args.out, 'w') as f:
+        json.dump({'environment': _environment(), 'results': results}, f,
+                  indent=2)
+    print('results written to %s' % args.out)
@@ -0,0 +1,88 @@
+"""
+Seeded synthetic data generators producing valid item responses for each
+questionnaire scorer and cognitive reserve proxies for the composite
+functions. Used by the benchmark scripts in this folder.
+"""
+import os
+import sys
+
+import numpy as np
+import pandas as pd
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                                os.pardir))
+from score_CRIq import CRIQ_ITEMS, CRIQ_SECTIONS
+from score_CSAQ_frequency import CSAQ_ITEMS
+from score_SNI_Cohen import SNI_ITEMS
+
+
+def make_proxies(n, k, seed=0, missing=0.05):
+    """ z-scored cognitive reserve proxies (index = subid) with missing
+    values. """
+    rng = np.random.default_rng(seed)
+    values = rng.standard_normal((n, k))
+    values[rng.random((n, k)) < missing] = np.nan
+    return pd.DataFrame(values, columns=['proxy%d' % i for i in range(k)],
+                        index=pd.RangeIndex(n, name='subid'))
+
+
+def make_CRIq(n, seed=0):
+    """ CRIq responses (columns named as in score_CRIq.CRIQ_ITEMS). """
+    rng = np.random.default_rng(seed)
+    data = {'subid': np.arange(n),
+            'age': rng.integers(18, 90, n).astype(np.float64),
+            'edu_school': rng.integers(0, 25, n).astype(np.float64),
+            'edu_training': rng.integers(0, 5, n).astype(np.float64)}
+    for item in CRIQ_SECTIONS['working']:
+        data[item] = (rng.integers(1, 40, n) *
+                      (rng.random(n) < 0.4)).astype(np.float64)
+    for item in CRIQ_SECTIONS['leisure_frequency']:
+        data[item] = rng.integers(0, 2, n).astype(np.float64)
+        data[item + '_years'] = (data[item] *
+                                 rng.integers(1, 60, n)).astype(np.float64)
+    data['children'] = rng.integers(0, 2, n).astype(np.float64)
+    data['children_number'] = (data['children'] *
+                               rng.integers(1, 5, n)).astype(np.float64)
+    return pd.DataFrame(data)[list(CRIQ_ITEMS)]
+
+
+def make_IPAQ(n, seed=0, missing=0.05):
+    """ IPAQ responses (subid + Q1 to Q7) with missing values. """
+    rng = np.random.default_rng(seed)
+    days = rng.integers(0, 8, (n, 3))
+    hours = rng.integers(0, 4, (n, 3))
+    mins = rng.integers(0, 60, (n, 3))
+    items = np.column_stack([days[:, 0], hours[:, 0], mins[:, 0],
+                             days[:, 1], hours[:, 1], mins[:, 1],
+                             days[:, 2], hours[:, 2], mins[:, 2],
+                             rng.integers(0, 600, n)]).astype(np.float64)
+    items[rng.random(items.shape) < missing] = np.nan
+    data = pd.DataFrame(items, columns=['Q1', 'Q2a', 'Q2b', 'Q3', 'Q4a',
+                                        'Q4b', 'Q5', 'Q6a', 'Q6b', 'Q7'])
+    data.insert(0, 'subid', np.arange(n))
+    return data
+
+
+def make_CSAQ(n, seed=0):
+    """ CSAQ frequency responses (1 to 5, index = subid). """
+    rng = np.random.default_rng(seed)
+    return pd.DataFrame(rng.integers(1, 6, (n, len(CSAQ_ITEMS))),
+                        columns=list(CSAQ_ITEMS), dtype=np.float64,
+                        index=pd.RangeIndex(n, name='subid'))
+
+
+def make_SNI(n, seed=0, missing=0.05):
+    """ SNI responses (index = subid) with missing values. """
+    rng = np.random.default_rng(seed)
+    data = pd.DataFrame(index=pd.RangeIndex(n, name='subid'))
+    for item in SNI_ITEMS:
+        if item == 'SNI_1':
+            data[item] = rng.integers(0, 3, n)
+        elif item in ('SNI_2a', 'SNI_3a', 'SNI_4a', 'SNI_5a'):
+            data[item] = rng.integers(0, 4, n)
+        elif item in ('SNI_11', 'SNI_12'):
+            data[item] = rng.integers(0, 2, n)
+        else:
+            data[item] = rng.integers(0, 8, n) * (rng.random(n) < 0.6)
+    data = data.astype(np.float64)
+    return data.mask(rng.random(data.shape) < missing)
@@ -1,86 +1,877 @@
+import json
+
+import numpy as np
 import pandas as pd
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor
 from itertools import combinations
+from multiprocessing import shared_memory
+
+from instrumentation import stages
+
+def _subset_masks(n_proxies):
+    """
+    Lists the bitmask of every non-empty subset of n_proxies columns, in the
+    same order as itertools.combinations (i.e. by subset size, then by column
+    order). Bit i of a mask is set if column i is part of the subset.
+
+    :param n_proxies: number of cognitive reserve proxies
+    :return masks: list of ints (length 2^n_proxies - 1)
+    """
+    return [sum(1 << i for i in combo) for size in range(1, n_proxies + 1)
+            for combo in combinations(range(n_proxies), size)]
+
+def _membership_matrix(masks, n_proxies):
+    """
+    Creates a 0/1 subset-membership matrix of size n_proxies * len(masks).
+    Entry [i, j] = 1 if proxy i is part of the subset given by masks[j].
+
+    :param masks: list of subset bitmasks (see _subset_masks)
+    :param n_proxies: number of cognitive reserve proxies
+    :return membership: float64 numpy array
+    """
+    masks = np.asarray(masks, dtype=np.int64)
+    bits = np.arange(n_proxies, dtype=np.int64)[:, None]
+    return ((masks[None, :] >> bits) & 1).astype(np.float64)
+
+def _composite_means(values, membership):
+    """
+    Averages the proxies in every subset with one matrix multiplication.
+    Missing values are skipped (as in pandas mean(axis=1)): masked sums are
+    divided by the number of non-missing proxies in each subset, and subsets
+    without any non-missing proxies are NaN.
+
+    :param values: float64 numpy array of size p * k (p = participants,
+                k = proxies)
+    :param membership: membership matrix of size k * c (c = composites)
+    :return means: float64 numpy array of size p * c
+    """
+    observed = ~np.isnan(values)
+    sums = np.where(observed, values, 0.0) @ membership
+    counts = observed.astype(np.float64) @ membership
+    with np.errstate(invalid='ignore', divide='ignore'):
+        np.divide(sums, counts, out=sums)
+    return sums
+
+def _incremental_means(values, masks):
+    """
+    Averages the proxies in every subset incrementally. Subsets are visited in
+    bitmask order, so each subset's parent (the subset minus its highest
+    column) has always been computed before it. The running sum and
+    non-missing count of a subset are its parent's plus one column, i.e. one
+    vector add per composite instead of one k-column reduction. Missing values
+    are skipped as in pandas mean(axis=1).
+
+    :param values: float64 numpy array of size p * k (p = participants,
+                k = proxies)
+    :param masks: list of subset bitmasks giving the output column order
+    :return means: float64 numpy array of size p * len(masks)
+    """
+    n_rows, n_proxies = values.shape
+    observed = ~np.isnan(values)
+
+    # one contiguous row per proxy/composite so each update is a vector add
+    filled = np.ascontiguousarray(np.where(observed, values, 0.0).T)
+    present = np.ascontiguousarray(observed.T.astype(np.uint8))
+    sums = np.empty((len(masks), n_rows))
+    counts = np.empty((len(masks), n_rows), dtype=np.uint8)
+
+    position = np.zeros(1 << n_proxies, dtype=np.int64)
+    position[masks] = np.arange(len(masks))
+
+    for mask in range(1, 1 << n_proxies):
+        top = mask.bit_length() - 1
+        parent = mask ^ (1 << top)
+        ix = position[mask]
+        if parent:
+            np.add(sums[position[parent]], filled[top], out=sums[ix])
+            np.add(counts[position[parent]], present[top], out=counts[ix])
+        else:
+            sums[ix] = filled[top]
+            counts[ix] = present[top]
+
+    with np.errstate(invalid='ignore', divide='ignore'):
+        np.divide(sums, counts, out=sums)
+    return sums.T
+
+def _composite_name(columns, mask):
+    """
+    Joins the labels of the columns in a subset bitmask, e.g. 'edu_occu'.
+    """
+    return '_'.join(col for i, col in enumerate(columns) if mask >> i & 1)
+
+def update_reference_stats(stats, batch):
+    """
+    Updates per-proxy reference statistics (count, mean and sum of squared
+    deviations) with a new batch of participants in one pass, merging the
+    batch into the running statistics with Welford/Chan online updates.
+    Missing values are skipped.
+
+    :param stats: dataframe returned by update_reference_stats or
+                  load_reference_stats (index = proxy, columns = n, mean,
+                  m2), or None to start from the first batch
+    :param batch: pandas dataframe containing subject ids (as the index) and
+                  cognitive reserve data
+    :return stats: updated dataframe of reference statistics
+    """
+    values = batch.to_numpy(dtype=np.float64)
+    observed = ~np.isnan(values)
+    n_batch = observed.sum(axis=0).astype(np.float64)
+    with np.errstate(invalid='ignore', divide='ignore'):
+        mean_batch = np.where(observed, values, 0.0).sum(axis=0) / n_batch
+    m2_batch = np.where(observed, values - mean_batch, 0.0)
+    m2_batch = (m2_batch * m2_batch).sum(axis=0)
+    mean_batch = np.nan_to_num(mean_batch)
+
+    if stats is None:
+        stats = pd.DataFrame(0.0, index=[str(col) for col in batch.columns],
+                             columns=['n', 'mean', 'm2'])
+        stats.index.name = 'proxy'
+    n_prev = stats['n'].to_numpy()
+    mean_prev = stats['mean'].to_numpy()
+
+    n = n_prev + n_batch
+    delta = mean_batch - mean_prev
+    with np.errstate(invalid='ignore', divide='ignore'):
+        weight = np.where(n > 0, n_batch / n, 0.0)
+    updated = pd.DataFrame({
+        'n': n,
+        'mean': mean_prev + delta * weight,
+        'm2': stats['m2'].to_numpy() + m2_batch + delta**2 * n_prev * weight,
+        }, index=stats.index)
+
+    return updated
+
+def reference_stats(batches):
+    """
+    Computes per-proxy reference statistics in one streaming pass over the
+    cohort, e.g. reference_stats(pd.read_csv(path, index_col=0,
+    chunksize=100000)), so the cohort does not need to fit in memory.
+
+    :param batches: iterable of pandas dataframes (or a single dataframe)
+                    containing subject ids (as the index) and cognitive
+                    reserve data
+    :return stats: dataframe of reference statistics (index = proxy,
+                   columns = n, mean, m2)
+    """
+    if isinstance(batches, pd.DataFrame):
+        batches = [batches]
+    stats = None
+    for batch in batches:
+        stats = update_reference_stats(stats, batch)
+    return stats
+
+def save_reference_stats(stats, path):
+    """
+    Saves reference statistics to a small JSON file.
+    """
+    with open(path, 'w') as f:
+        json.dump({'proxy': stats.index.tolist(),
+                   'n': stats['n'].tolist(),
+                   'mean': stats['mean'].tolist(),
+                   'm2': stats['m2'].tolist()}, f, indent=1)
+
+def load_reference_stats(path):
+    """
+    Loads reference statistics saved with save_reference_stats.
+    """
+    with open(path) as f:
+        saved = json.load(f)
+    return pd.DataFrame({'n': saved['n'], 'mean': saved['mean'],
+                         'm2': saved['m2']},
+                        index=pd.Index(saved['proxy'], name='proxy'))
 
-def create_unique_combinations(df):
+def standardise(df, stats, ddof=1):
+    """
+    Standardises (z-scores) cognitive reserve proxies with reference
+    statistics, so new batches of participants can be standardised without
+    rescanning the cohort. The output can be passed to
+    create_unique_combinations (or the other composite functions).
+
+    :param df: pandas dataframe containing subject ids (as the index) and
+                cognitive reserve data (same columns as used for stats)
+    :param stats: reference statistics (see reference_stats)
+    :param ddof: delta degrees of freedom for the SD (default 1, as pandas)
+    :return z: dataframe of z-scores with same index and columns as df
+    """
+    stats = stats.loc[[str(col) for col in df.columns]]
+    mean = stats['mean'].to_numpy()
+    sd = np.sqrt(stats['m2'].to_numpy() / (stats['n'].to_numpy() - ddof))
+    z = (df.to_numpy(dtype=np.float64) - mean) / sd
+    return pd.DataFrame(z, index=df.index, columns=df.columns)
+
+def create_unique_combinations(df, method='matmul'):
     """
     Creates a composite measure for every possible combination of
     cognitive reserve proxies. Credit to StackOverflow User WeNYoBenfor optimising my code and giving 
     a better solution https://stackoverflow.com/a/58895156/12384217
 
+    Each composite is the mean of its non-missing proxies, as with
+    df[subset].mean(axis=1). With method='matmul', all composites are computed
+    together by multiplying the proxies (and their non-missing mask) with a
+    0/1 subset-membership matrix (k * 2^k - 1). With method='incremental',
+    each composite is built from its parent subset with one vector add, which
+    is O(p * 2^k) rather than O(p * k * 2^k).
+
     :param df: pandas dataframe containing subject ids (as the index) and
                 cognitive reserve data
+    :param method: 'matmul' (default) or 'incremental'
     :return composites: dataframe with every possible unique combination of 
     original dataframe (df) columns
     """
-    # Create unique combinations of each column, without repetition, based on column labels
-    unique_combos = sum([list(map(list, combinations(df.columns, i)))
-            for i in range(len(df.columns) + 1)], [])
-    
-    # Average the columns in each unique combination and add to a new dataframe
-    composites= pd.DataFrame(
-            {'_'.join(x) : df[x].mean(axis=1) for x in unique_combos if x !=[]})
+    stage = stages('create_unique_combinations', len(df))
+    columns = [str(col) for col in df.columns]
+    masks = _subset_masks(len(columns))
+    values = df.to_numpy(dtype=np.float64)
+    stage('read')
+
+    # Average the columns in each unique combination
+    if method == 'matmul':
+        means = _composite_means(values,
+                                 _membership_matrix(masks, len(columns)))
+    elif method == 'incremental':
+        means = _incremental_means(values, masks)
+    else:
+        raise ValueError("method must be 'matmul' or 'incremental'")
+    stage('means')
+
+    composites = pd.DataFrame(
+            means, index=df.index, copy=False,
+            columns=[_composite_name(columns, mask) for mask in masks])
+    stage('frame')
   
     return composites
 
-def test_unique_combinations(df, columns, composites):
+def _parallel_worker(in_name, in_shape, out_name, out_shape, masks, start):
+    """
+    Computes the composites for one contiguous block of subsets and writes
+    them into columns start:start + len(masks) of the shared output array.
+    """
+    shm_in = shared_memory.SharedMemory(name=in_name)
+    shm_out = shared_memory.SharedMemory(name=out_name)
+    try:
+        values = np.ndarray(in_shape, dtype=np.float64, buffer=shm_in.buf)
+        out = np.ndarray(out_shape, dtype=np.float64, buffer=shm_out.buf)
+        out[:, start:start + len(masks)] = _composite_means(
+                values, _membership_matrix(masks, in_shape[1]))
+        del values, out
+    finally:
+        shm_in.close()
+        shm_out.close()
+    return start
+
+def create_unique_combinations_parallel(df, n_workers=None,
+                                        subsets_per_task=4096):
     """
-    Runs some basic tests to check composites were created as intended.
+    Creates the same composites as create_unique_combinations, split across a
+    process pool. The subset lattice is cut into contiguous blocks of
+    subsets_per_task composites (in the usual column order) and each task
+    writes its block straight into a preallocated shared output array, so
+    the column order does not depend on which worker finishes first. Workers
+    read the proxies from shared memory instead of receiving a pickled copy
+    per task.
+    Note: on Windows/macOS (spawn start method), call this function from
+    within an if __name__ == '__main__': block.
+
+    :param df: pandas dataframe containing subject ids (as the index) and
+                cognitive reserve data
+    :param n_workers: number of worker processes (default = number of CPUs)
+    :param subsets_per_task: number of composites computed per task
+    :return composites: dataframe with every possible unique combination of 
+    original dataframe (df) columns
+    """
+    columns = [str(col) for col in df.columns]
+    masks = _subset_masks(len(columns))
+    values = df.to_numpy(dtype=np.float64)
+    out_shape = (len(values), len(masks))
+
+    shm_in = shared_memory.SharedMemory(create=True,
+                                        size=max(values.nbytes, 1))
+    shm_out = shared_memory.SharedMemory(
+            create=True, size=max(out_shape[0] * out_shape[1] * 8, 1))
+    try:
+        np.ndarray(values.shape, dtype=np.float64,
+                   buffer=shm_in.buf)[:] = values
+
+        with ProcessPoolExecutor(max_workers=n_workers) as pool:
+            tasks = [pool.submit(_parallel_worker, shm_in.name, values.shape,
+                                 shm_out.name, out_shape,
+                                 masks[start:start + subsets_per_task], start)
+                     for start in range(0, len(masks), subsets_per_task)]
+            for task in tasks:
+                task.result()
+
+        means = np.ndarray(out_shape, dtype=np.float64,
+                           buffer=shm_out.buf).copy()
+    finally:
+        shm_in.close()
+        shm_in.unlink()
+        shm_out.close()
+        shm_out.unlink()
+
+    composites = pd.DataFrame(
+            means, index=df.index, copy=False,
+            columns=[_composite_name(columns, mask) for mask in masks])
+
+    return composites
+
+def iter_composite_blocks(df, rows_per_block=None, subsets_per_block=None):
+    """
+    Creates the same composites as create_unique_combinations, but yields
+    them one block at a time so that peak memory is bounded by the block size
+    (rows_per_block * subsets_per_block) rather than by p * (2^k - 1).
+    Blocks are yielded row block by row block and, within each row block, in
+    the column order of create_unique_combinations.
+
+    :param df: pandas dataframe containing subject ids (as the index) and
+                cognitive reserve data
+    :param rows_per_block: number of participants per block (default = all)
+    :param subsets_per_block: number of composites per block (default = all)
+    :return: generator of (rows, cols, block) tuples. rows and cols are
+             slices into the full composites matrix and block is a float64
+             numpy array of size len(rows) * len(cols)
+    """
+    values = df.to_numpy(dtype=np.float64)
+    masks = _subset_masks(values.shape[1])
+    rows_per_block = rows_per_block or max(len(values), 1)
+    subsets_per_block = subsets_per_block or len(masks)
+
+    for row_start in range(0, len(values), rows_per_block):
+        rows = slice(row_start, min(row_start + rows_per_block, len(values)))
+        for col_start in range(0, len(masks), subsets_per_block):
+            cols = slice(col_start,
+                         min(col_start + subsets_per_block, len(masks)))
+            membership = _membership_matrix(masks[cols], values.shape[1])
+            yield rows, cols, _composite_means(values[rows], membership)
+
+def write_composites(df, sink, rows_per_block=None, subsets_per_block=None):
+    """
+    Streams every composite to a sink (MemmapSink, HDF5Sink or ParquetSink)
+    block by block without holding all composites in memory.
+
+    :param df: pandas dataframe containing subject ids (as the index) and
+                cognitive reserve data
+    :param sink: sink object with open(index, names), write(rows, cols, block)
+                 and close() methods
+    :param rows_per_block: number of participants per block (default = all)
+    :param subsets_per_block: number of composites per block (default = all)
+    :return sink: the sink, after it has been closed
+    """
+    columns = [str(col) for col in df.columns]
+    names = [_composite_name(columns, mask)
+             for mask in _subset_masks(len(columns))]
+
+    sink.open(df.index, names)
+    try:
+        for rows, cols, block in iter_composite_blocks(df, rows_per_block,
+                                                       subsets_per_block):
+            sink.write(rows, cols, block)
+    finally:
+        sink.close()
+
+    return sink
+
+class MemmapSink:
+    """
+    Writes composites into a memory-mapped .npy file of size p * (2^k - 1).
+    Reopen with np.load(path, mmap_mode='r').
+    """
+    def __init__(self, path, dtype=np.float64):
+        self.path = path
+        self.dtype = dtype
+        self.array = None
+
+    def open(self, index, names):
+        self.array = np.lib.format.open_memmap(
+                self.path, mode='w+', dtype=self.dtype,
+                shape=(len(index), len(names)))
+
+    def write(self, rows, cols, block):
+        self.array[rows, cols] = block
+
+    def close(self):
+        self.array.flush()
+
+class HDF5Sink:
+    """
+    Writes composites into a chunked HDF5 dataset (requires h5py). Subject ids
+    and composite names are stored alongside as '<dataset>_index' and
+    '<dataset>_names'.
+    """
+    def __init__(self, path, dataset='composites', chunks=True,
+                 dtype=np.float64):
+        self.path = path
+        self.dataset = dataset
+        self.chunks = chunks
+        self.dtype = dtype
+        self.file = None
+
+    def open(self, index, names):
+        import h5py
+        self.file = h5py.File(self.path, 'w')
+        self.data = self.file.create_dataset(
+                self.dataset, shape=(len(index), len(names)),
+                dtype=self.dtype, chunks=self.chunks)
+        self.file.create_dataset(self.dataset + '_index',
+                                 data=np.asarray(index).astype(str).astype('S'))
+        self.file.create_dataset(self.dataset + '_names',
+                                 data=np.asarray(names, dtype='S'))
+
+    def write(self, rows, cols, block):
+        self.data[rows, cols] = block
+
+    def close(self):
+        self.file.close()
+
+class ParquetSink:
+    """
+    Writes composites to a Parquet file with one row group per block of
+    participants (requires pyarrow). Column blocks for the same participants
+    are buffered until the row group is complete, so memory is bounded by
+    rows_per_block * (2^k - 1).
+    """
+    def __init__(self, path, index_name='subid'):
+        self.path = path
+        self.index_name = index_name
+        self.writer = None
+
+    def open(self, index, names):
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+        self._pa = pa
+        self.index = index
+        self.names = names
+        self.pending = {}
+        schema = pa.schema(
+                [(self.index_name, pa.array(np.asarray(index)).type)] +
+                [(name, pa.float64()) for name in names])
+        self.writer = pq.ParquetWriter(self.path, schema)
+
+    def write(self, rows, cols, block):
+        for j, name in enumerate(self.names[cols]):
+            self.pending[name] = block[:, j]
+        if len(self.pending) == len(self.names):
+            arrays = [self._pa.array(np.asarray(self.index[rows]))]
+            arrays += [self._pa.array(self.pending[name])
+                       for name in self.names]
+            self.writer.write_table(self._pa.Table.from_arrays(
+                    arrays, schema=self.writer.schema))
+            self.pending = {}
+
+    def close(self):
+        self.writer.close()
+
+class Composites:
+    """
+    Lazy, on-demand view of every composite of the cognitive reserve proxies
+    in df. Composites are named as in create_unique_combinations (e.g.
+    'edu_occu_leisure') but each one is only computed when it is accessed,
+    and recently used composites are kept in an LRU cache whose size is
+    bounded by max_cache_bytes.
+
+    Usage:
+        composites = Composites(df)
+        len(composites)                   # 2^k - 1
+        composites['edu_occu']            # pandas series
+        composites[['edu', 'occu']]       # same composite, by column labels
+        for name in composites: ...       # names in create_unique_combinations order
+
+    :param df: pandas dataframe containing subject ids (as the index) and
+                cognitive reserve data
+    :param max_cache_bytes: memory budget for cached composites (default 256 MB)
+    """
+    def __init__(self, df, max_cache_bytes=256 * 2**20):
+        self.index = df.index
+        self.columns = [str(col) for col in df.columns]
+        self.max_cache_bytes = max_cache_bytes
+
+        values = df.to_numpy(dtype=np.float64)
+        observed = ~np.isnan(values)
+        self._filled = np.ascontiguousarray(np.where(observed, values, 0.0).T)
+        self._present = np.ascontiguousarray(observed.T.astype(np.float64))
+
+        self._cache = OrderedDict()
+        self._cache_bytes = 0
+
+    def __len__(self):
+        return 2**len(self.columns) - 1
+
+    def __iter__(self):
+        for size in range(1, len(self.columns) + 1):
+            for combo in combinations(self.columns, size):
+                yield '_'.join(combo)
+
+    def __contains__(self, key):
+        try:
+            self._mask(key)
+        except KeyError:
+            return False
+        return True
+
+    def __getitem__(self, key):
+        mask = self._mask(key)
+        if mask in self._cache:
+            self._cache.move_to_end(mask)
+            return self._cache[mask]
+
+        rows = [i for i in range(len(self.columns)) if mask >> i & 1]
+        sums = self._filled[rows].sum(axis=0)
+        counts = self._present[rows].sum(axis=0)
+        with np.errstate(invalid='ignore', divide='ignore'):
+            np.divide(sums, counts, out=sums)
+        composite = pd.Series(sums, index=self.index,
+                              name=_composite_name(self.columns, mask))
+
+        if composite.nbytes <= self.max_cache_bytes:
+            self._cache[mask] = composite
+            self._cache_bytes += composite.nbytes
+            while self._cache_bytes > self.max_cache_bytes:
+                self._cache_bytes -= self._cache.popitem(last=False)[1].nbytes
+        return composite
+
+    def keys(self):
+        return iter(self)
+
+    def _mask(self, key):
+        """
+        Converts a composite name (e.g. 'edu_occu') or a list of column labels
+        into a subset bitmask. Names are matched against the column labels in
+        column order, so labels may themselves contain underscores.
+        """
+        def match(rest, first):
+            if not rest:
+                return 0
+            for i in range(first, len(self.columns)):
+                col = self.columns[i]
+                if rest == col:
+                    return 1 << i
+                if rest.startswith(col + '_'):
+                    tail = match(rest[len(col) + 1:], i + 1)
+                    if tail is not None:
+                        return (1 << i) | tail
+            return None
+
+        if isinstance(key, str):
+            mask = match(key, 0)
+        else:
+            labels = set(str(col) for col in key)
+            mask = sum(1 << i for i, col in enumerate(self.columns)
+                       if col in labels)
+            if len(labels) != bin(mask).count('1'):
+                mask = None
+
+        if not mask:
+            raise KeyError('%r is not a composite of the proxy columns'
+                           % (key,))
+        return mask
+
+class CompositeArray:
+    """
+    Array-backed composites: one contiguous (column-major) numpy array of
+    size p * (2^k - 1), usually memory-mapped from a .npy file, where column
+    mask - 1 holds the composite for subset bitmask mask (bit i set = proxy
+    column i included). Composite labels (e.g. 'edu_occu') are only built
+    when asked for. Create with create_composite_array and reopen with
+    CompositeArray.open(path).
+
+    :param values: numpy array or memmap of size p * (2^k - 1)
+    :param columns: list of proxy column names
+    :param index: subject ids
+    """
+    def __init__(self, values, columns, index):
+        self.values = values
+        self.columns = [str(col) for col in columns]
+        self.index = index
+
+    @classmethod
+    def open(cls, path, mode='r'):
+        """
+        Reopens composites saved by create_composite_array without reading
+        them into memory.
+        """
+        with open(path + '.json') as f:
+            meta = json.load(f)
+        return cls(np.load(path, mmap_mode=mode), meta['columns'],
+                   pd.Index(meta['index'], name=meta['index_name']))
+
+    def __len__(self):
+        return self.values.shape[1]
+
+    def column(self, mask):
+        """ Composite for a subset bitmask (numpy array of size p). """
+        return self.values[:, mask - 1]
+
+    def name(self, mask):
+        """ Label of the composite for a subset bitmask, e.g. 'edu_occu'. """
+        return _composite_name(self.columns, mask)
+
+    def mask(self, columns):
+        """ Subset bitmask for a list of proxy column names. """
+        return sum(1 << self.columns.index(str(col)) for col in set(columns))
+
+    def to_frame(self, masks=None):
+        """
+        Dataframe of selected composites (default all), with labels.
+        """
+        masks = np.arange(1, len(self) + 1) if masks is None \
+            else np.asarray(masks)
+        return pd.DataFrame(self.values[:, masks - 1], index=self.index,
+                            columns=[self.name(mask) for mask in masks])
+
+def create_composite_array(df, path=None, dtype=np.float32,
+                           rows_per_block=None, subsets_per_block=4096):
+    """
+    Creates every composite (as create_unique_combinations) in a compact
+    array indexed by subset bitmask instead of a dataframe with one labelled
+    column per composite. With dtype=np.float32 this halves memory compared
+    with float64 columns, and with a path the array is written to a
+    memory-mapped .npy file (plus a small '<path>.json' with proxy names and
+    subject ids) that can be reopened instantly with CompositeArray.open.
+    Composites are computed in blocks of rows_per_block participants by
+    subsets_per_block composites, each with one membership-matrix product
+    (the membership matrix of a block of composites is built once).
+
+    :param df: pandas dataframe containing subject ids (as the index) and
+                cognitive reserve data
+    :param path: .npy file to write to (default = keep in memory)
+    :param dtype: numpy dtype of stored composites (float32 or float64)
+    :param rows_per_block: number of participants computed at a time
+                           (default = about 64 MB of float64 per block)
+    :param subsets_per_block: number of composites computed at a time
+    :return composites: CompositeArray
+    """
+    columns = [str(col) for col in df.columns]
+    values = df.to_numpy(dtype=np.float64)
+    masks = list(range(1, 2**len(columns)))
+    shape = (len(values), len(masks))
+
+    if path is None:
+        out = np.empty(shape, dtype=dtype, order='F')
+    else:
+        out = np.lib.format.open_memmap(path, mode='w+', dtype=dtype,
+                                        shape=shape, fortran_order=True)
+        with open(path + '.json', 'w') as f:
+            json.dump({'columns': columns, 'index': df.index.tolist(),
+                       'index_name': df.index.name}, f)
+
+    masks = np.asarray(masks, dtype=np.int64)
+    subsets_per_block = min(subsets_per_block, max(len(masks), 1))
+    rows_per_block = rows_per_block or max(1, 2**23 // subsets_per_block)
+    for col_start in range(0, len(masks), subsets_per_block):
+        cols = slice(col_start, col_start + subsets_per_block)
+        membership = _membership_matrix(masks[cols], len(columns))
+        for start in range(0, len(values), rows_per_block):
+            rows = slice(start, start + rows_per_block)
+            out[rows, cols] = _composite_means(values[rows], membership)
+
+    if path is not None:
+        out.flush()
+    return CompositeArray(out, columns, df.index)
+
+def top_composites(df, target, top_k=10, metric='r2', search='auto',
+                   beam_width=1000, max_exhaustive=20,
+                   subsets_per_block=2**16):
+    """
+    Finds the composites most strongly correlated with a target variable
+    without creating any composite. The correlation of a mean composite of
+    subset S with target y is a closed-form function of the proxy
+    covariances C and proxy-target covariances b:
+        r(S) = sum(b[S]) / sqrt(sum(C[S, S]) * var(y))
+    Note: covariances are computed on complete cases (participants with no
+    missing proxies or target), where composites are plain means.
+
+    With search='exhaustive', r is evaluated for all 2^k - 1 subsets in
+    blocks (feasible up to ~25 proxies). With search='beam', subsets are
+    grown one proxy at a time, keeping the beam_width best subsets of each
+    size, which scales to k = 30+ proxies (but is not guaranteed to find the
+    best subsets). search='auto' uses exhaustive search for up to
+    max_exhaustive proxies and beam search otherwise.
+
+    :param df: pandas dataframe containing subject ids (as the index) and
+                cognitive reserve data
+    :param target: pandas series (same index as df) or array with target
+                   variable
+    :param top_k: number of composites to return
+    :param metric: 'r2' (default - strongest correlation in either direction)
+                   or 'r' (strongest positive correlation)
+    :param search: 'auto', 'exhaustive' or 'beam'
+    :param beam_width: number of subsets kept per subset size in beam search
+    :param max_exhaustive: largest number of proxies for exhaustive search
+                           when search='auto'
+    :param subsets_per_block: number of subsets evaluated at a time in
+                              exhaustive search
+    :return top: dataframe with top_k composites sorted from best to worst
+                 with columns: composite (name), mask (subset bitmask),
+                 n_proxies, r, r2
+    """
+    columns = [str(col) for col in df.columns]
+    n_proxies = len(columns)
+    y = target.reindex(df.index) if isinstance(target, pd.Series) \
+        else pd.Series(np.asarray(target, dtype=np.float64), index=df.index)
+
+    # covariances on complete cases
+    data = np.column_stack([df.to_numpy(dtype=np.float64),
+                            y.to_numpy(dtype=np.float64)])
+    data = data[~np.isnan(data).any(axis=1)]
+    cov = np.cov(data, rowvar=False)
+    C, b, var_y = cov[:-1, :-1], cov[:-1, -1], cov[-1, -1]
+
+    def score(r):
+        return r * r if metric == 'r2' else r
+    if metric not in ('r', 'r2'):
+        raise ValueError("metric must be 'r' or 'r2'")
+
+    if search == 'auto':
+        search = 'exhaustive' if n_proxies <= max_exhaustive else 'beam'
+
+    if search == 'exhaustive':
+        best_masks = np.empty(0, dtype=np.int64)
+        best_r = np.empty(0)
+        for start in range(1, 2**n_proxies, subsets_per_block):
+            masks = np.arange(start, min(start + subsets_per_block,
+                                         2**n_proxies), dtype=np.int64)
+            M = _membership_matrix(masks, n_proxies)
+            quad = np.einsum('ij,ij->j', C @ M, M)
+            r = (b @ M) / np.sqrt(quad * var_y)
+            best_masks = np.concatenate([best_masks, masks])
+            best_r = np.concatenate([best_r, r])
+            if len(best_r) > top_k:
+                keep = np.argpartition(-score(best_r), top_k - 1)[:top_k]
+                best_masks, best_r = best_masks[keep], best_r[keep]
+
+    elif search == 'beam':
+        # beam of subsets of the current size: masks, sum(b[S]), sum(C[S, S])
+        # and C @ u_S (used to add one proxy with one vector operation)
+        masks = np.zeros(1, dtype=np.int64)
+        num = np.zeros(1)
+        quad = np.zeros(1)
+        Cu = np.zeros((1, n_proxies))
+        bits = np.int64(1) << np.arange(n_proxies, dtype=np.int64)
+        best_masks, best_r = np.empty(0, dtype=np.int64), np.empty(0)
+        for size in range(1, n_proxies + 1):
+            # every subset in the beam plus one proxy not yet in it
+            new_masks = (masks[:, None] | bits[None, :]).ravel()
+            valid = ((masks[:, None] & bits[None, :]) == 0).ravel()
+            new_num = (num[:, None] + b[None, :]).ravel()
+            new_quad = (quad[:, None] + 2 * Cu + np.diag(C)[None, :]).ravel()
+            parent = np.repeat(np.arange(len(masks)), n_proxies)
+            proxy = np.tile(np.arange(n_proxies), len(masks))
+
+            # drop duplicates (same subset reached from different parents)
+            new_masks, first = np.unique(np.where(valid, new_masks, 0),
+                                         return_index=True)
+            first, new_masks = first[new_masks > 0], new_masks[new_masks > 0]
+            r = new_num[first] / np.sqrt(new_quad[first] * var_y)
+
+            keep = np.argsort(-score(r))[:beam_width]
+            masks, r = new_masks[keep], r[keep]
+            num, quad = new_num[first][keep], new_quad[first][keep]
+            Cu = Cu[parent[first][keep]] + C[proxy[first][keep]]
+
+            best_masks = np.concatenate([best_masks, masks])
+            best_r = np.concatenate([best_r, r])
+            if len(best_r) > top_k:
+                keep = np.argpartition(-score(best_r), top_k - 1)[:top_k]
+                best_masks, best_r = best_masks[keep], best_r[keep]
+    else:
+        raise ValueError("search must be 'auto', 'exhaustive' or 'beam'")
+
+    order = np.argsort(-score(best_r), kind='stable')[:top_k]
+    best_masks, best_r = best_masks[order], best_r[order]
+    top = pd.DataFrame({
+        'composite': [_composite_name(columns, int(mask))
+                      for mask in best_masks],
+        'mask': best_masks,
+        'n_proxies': [bin(int(mask)).count('1') for mask in best_masks],
+        'r': best_r,
+        'r2': best_r**2,
+        })
+
+    return top
+
+def test_unique_combinations(df, columns, composites, subsets_per_block=4096,
+                             rtol=1e-05, atol=1e-08):
+    """
+    Checks composites were created as intended, in one vectorized pass over
+    every composite:
+        1) all composite names are unique
+        2) the number of composites equals 2^k - 1 (exact integer arithmetic)
+        3) every expected composite name is present
+        4) every composite equals the mean of its underlying proxies (all
+           composites are recomputed block by block with a membership-matrix
+           product and compared with np.isclose, treating NaNs as equal)
 
     :param df: pandas dataframe containing subject ids (as the index) and
                 cognitive reserve data
     :param columns: List of strings containing column names for columns in data
                     containing cognitive reserve proxies.
     :param composites: df returned by create_unique_combinations(data, columns)
-    :return cogResComposites: dataframe with every possible unique combination of 'columns' in 'data'.
-    """
-    # SANITY CHECK 1 - all column names in cogRes_composites should be unique
-    comboNames = composites.columns.tolist()
-    unique_elements_list = list(set(comboNames))
-    errors = 0
-    if len(comboNames) == len(unique_elements_list):
-        print("Ok to proceed")
-    else:
-        print("STOP - CHECK DATA -  \nNot all column names in composite df (cogRes_composites) are unique")
-        errors += 1
-
-    # SANITY CHECK 2 - number of unique column names should equal number of 
-    # possible combinations of proxies without repetition
-    number_proxies = len(df.columns.tolist())
-    
-    # calculate number of combos of n elements taken k in k
-    def possibleCombos(n, k):
-        combos = math.factorial(n) / (math.factorial(k) * math.factorial(n -k))
-        return combos
-    
-    uniqueCombos = 0
-    
-    for i in range(1, number_proxies+1):
-       uniqueCombos += possibleCombos(number_proxies, i)
-       
-    if uniqueCombos == len(unique_elements_list):
-        print("Ok to proceed")
-    else:
-        print("STOP - CHECK DATA -  \nNumber of unique columns not equal to the number of unique combinations")
-        errors += 1
-        
-    # SANITY CHECK 3 - check three random columns are actually combinations of
-    # their respective underlying columns - e.g. check edu_occu is actually 
-    # equal to the sum of edu and occu columns from original data 
-    
-    # get 5 random columns
-    randomCols = composites.sample(5, axis=1).columns.tolist()
-    
-    for col in randomCols:
-        underlyingCols = col.split("_")
-        if composites[col].equals(
-                composites[underlyingCols].sum(axis=1, skipna=False)):
-            print("Ok to proceed")
-        else:
-            print("\nSTOP - CHECK DATA \n" + col + 
-                  " not equal to the sum of \n" + ' + '.join(underlyingCols))
-            errors += 1
-    
-    if errors == 0:
-        print('Composites created fine - no problems identified')
-    else:
-        print('Error in creation of composites - please inspect data\n See above message for further info')
+    :param subsets_per_block: number of composites recomputed at a time
+    :param rtol: relative tolerance for the value check
+    :param atol: absolute tolerance for the value check
+    :return report: dict with following keys:
+                    - passed = True if all checks passed
+                    - names_unique = check 1
+                    - n_composites / n_expected / count_ok = check 2
+                    - missing = expected composite names not in composites
+                    - mismatched = composite names failing check 4
+                    - max_abs_diff = largest absolute difference in check 4
+    """
+    proxies = df[list(columns)] if columns is not None else df
+    proxy_names = [str(col) for col in proxies.columns]
+    values = proxies.to_numpy(dtype=np.float64)
+    masks = _subset_masks(len(proxy_names))
+    expected = [_composite_name(proxy_names, mask) for mask in masks]
+
+    # CHECK 1 + 2 - unique names and number of combinations
+    names_unique = bool(composites.columns.is_unique)
+    n_composites = composites.shape[1]
+    n_expected = 2**len(proxy_names) - 1
+    if not names_unique:
+        composites = composites.loc[:, ~composites.columns.duplicated()]
+
+    # CHECK 3 - expected names present
+    position = composites.columns.get_indexer(expected)
+    missing = [name for name, ix in zip(expected, position) if ix < 0]
+
+    # CHECK 4 - recompute every composite and compare
+    if not composites.index.equals(proxies.index):
+        composites = composites.reindex(proxies.index)
+    composite_values = composites.to_numpy(dtype=np.float64)
+    mismatched = []
+    max_abs_diff = 0.0
+    for start in range(0, len(masks), subsets_per_block):
+        block = slice(start, start + subsets_per_block)
+        ix = position[block]
+        found = ix >= 0
+        recomputed = _composite_means(
+                values, _membership_matrix(np.asarray(masks[block])[found],
+                                           len(proxy_names)))
+        actual = composite_values[:, ix[found]]
+
+        # |actual - recomputed| <= atol + rtol * |recomputed|, NaNs equal
+        bad = np.isnan(actual) != np.isnan(recomputed)
+        np.subtract(actual, recomputed, out=actual)
+        np.abs(actual, out=actual)
+        np.abs(recomputed, out=recomputed)
+        recomputed *= rtol
+        recomputed += atol
+        bad |= actual > recomputed
+        mismatched.extend(np.asarray(expected[block], dtype=object)[found]
+                          [bad.any(axis=0)])
+        if not np.isnan(actual).all():
+            max_abs_diff = max(max_abs_diff, float(np.nanmax(actual)))
+
+    report = {
+        'names_unique': names_unique,
+        'n_composites': n_composites,
+        'n_expected': n_expected,
+        'count_ok': n_composites == n_expected,
+        'missing': missing,
+        'mismatched': mismatched,
+        'max_abs_diff': max_abs_diff,
+    }
+    report['passed'] = (names_unique and report['count_ok'] and not missing
+                        and not mismatched)
+
+    return report
@@ -0,0 +1,262 @@
+"""
+Optional per-stage instrumentation of the scorers and composite functions.
+
+Each scorer marks the end of its named stages (e.g. score_CRIq.edu,
+score_CRIq.working) and, while hooks are registered with instrument(), every
+stage produces a record (dict) with:
+    - stage = '<function>.<stage name>'
+    - seconds = wall time of the stage
+    - rows = number of participants processed
+    - bytes = peak memory allocated during the stage (None unless
+              tracemalloc is tracing, e.g. with TracemallocHook)
+
+tracemalloc measures the whole process, so bytes is only reported for a
+stage during which no other instrumented call started a stage. When
+scorers run concurrently (e.g. in score_wave's thread pool) their stages
+overlap and get bytes = None; seconds and rows are still recorded.
+
+Instrumentation is off by default - with no hooks registered a stage mark is
+a single no-op call.
+
+Example:
+    with instrument(JSONLinesHook('stages.jsonl'), TracemallocHook()):
+        score_CRIq(df)
+"""
+import json
+import threading
+import time
+from contextlib import contextmanager
+
+import pandas as pd
+
+# registered hooks - callables taking one stage record
+_HOOKS = []
+_LOCK = threading.Lock()
+
+# stage marker that last reset the tracemalloc peak - the peak is only
+# meaningful for the stage of that marker
+_PEAK_OWNER = None
+_PEAK_LOCK = threading.Lock()
+
+
+def add_hook(hook):
+    """ Registers a hook (callable taking a stage record) and calls its
+    start() method if it has one. """
+    with _LOCK:
+        if hasattr(hook, 'start'):
+            hook.start()
+        _HOOKS.append(hook)
+
+
+def remove_hook(hook):
+    """ Unregisters a hook and calls its stop() method if it has one. """
+    with _LOCK:
+        _HOOKS.remove(hook)
+        if hasattr(hook, 'stop'):
+            hook.stop()
+
+
+@contextmanager
+def instrument(*hooks):
+    """
+    Registers hooks for the duration of a with block.
+
+    :param hooks: callables taking one stage record (dict), e.g.
+                  JSONLinesHook, ProfileHook, TracemallocHook, RecordHook or
+                  any function
+    """
+    for hook in hooks:
+        add_hook(hook)
+    try:
+        yield hooks
+    finally:
+        for hook in reversed(hooks):
+            remove_hook(hook)
+
+
+class _NoStages:
+    """ Stage marker used while no hooks are registered. """
+
+    def __call__(self, name, rows=None):
+        pass
+
+
+_NO_STAGES = _NoStages()
+
+
+class _Stages:
+    """ Stage marker of one call of an instrumented function. """
+
+    def __init__(self, scope, rows):
+        self.scope = scope
+        self.rows = rows
+        self._begin()
+
+    def _begin(self):
+        global _PEAK_OWNER
+        import tracemalloc
+        if tracemalloc.is_tracing():
+            with _PEAK_LOCK:
+                tracemalloc.reset_peak()
+                self._memory = tracemalloc.get_traced_memory()[0]
+                _PEAK_OWNER = self
+        else:
+            self._memory = None
+        self._start = time.perf_counter()
+
+    def __call__(self, name, rows=None):
+        """ Ends stage name, which started at the previous mark (or when the
+        marker was created), and passes its record to every hook. """
+        import tracemalloc
+        seconds = time.perf_counter() - self._start
+        allocated = None
+        if self._memory is not None and tracemalloc.is_tracing():
+            with _PEAK_LOCK:
+                # None if another marker reset the peak during this stage
+                if _PEAK_OWNER is self:
+                    allocated = (tracemalloc.get_traced_memory()[1]
+                                 - self._memory)
+        record = {'stage': self.scope + '.' + name, 'seconds': seconds,
+                  'rows': self.rows if rows is None else rows,
+                  'bytes': allocated}
+        for hook in list(_HOOKS):
+            hook(record)
+        # time spent in hooks is not counted towards the next stage
+        self._begin()
+
+
+def stages(scope, rows=None):
+    """
+    Returns a stage marker for one call of an instrumented function. Calling
+    the marker with a stage name ends that stage:
+
+        stage = stages('score_CRIq', len(df))
+        ...
+        stage('edu')
+
+    :param scope: name of the instrumented function
+    :param rows: number of participants processed
+    :return stage: callable stage(name, rows=None) - a no-op when no hooks
+                   are registered
+    """
+    if not _HOOKS:
+        return _NO_STAGES
+    return _Stages(scope, rows)
+
+
+class JSONLinesHook:
+    """ Writes every stage record as one line of JSON to a file. """
+
+    def __init__(self, path, mode='a'):
+        """
+        :param path: path of the .jsonl file, or an open text file
+        :param mode: file mode used when path is a file name
+        """
+        self.path = path
+        self.mode = mode
+        self._file = None
+        self._owns_file = False
+        self._lock = threading.Lock()
+
+    def start(self):
+        if isinstance(self.path, str):
+            self._file = open(self.path, self.mode)
+            self._owns_file = True
+        else:
+            self._file = self.path
+
+    def stop(self):
+        if self._owns_file:
+            self._file.close()
+        else:
+            self._file.flush()
+        self._file = None
+
+    def __call__(self, record):
+        with self._lock:
+            self._file.write(json.dumps(record) + '\n')
+
+
+class RecordHook:
+    """ Keeps every stage record in memory (see to_frame). """
+
+    def __init__(self):
+        self.records = []
+
+    def __call__(self, record):
+        self.records.append(record)
+
+    def to_frame(self):
+        """ Records as a dataframe (one row per stage call). """
+        return pd.DataFrame(self.records,
+                            columns=['stage', 'seconds', 'rows', 'bytes'])
+
+    def summary(self):
+        """ Total seconds, rows and calls of each stage, slowest first. """
+        frame = self.to_frame()
+        return frame.groupby('stage').agg(
+                seconds=('seconds', 'sum'), rows=('rows', 'sum'),
+                calls=('seconds', 'size')).sort_values('seconds',
+                                                       ascending=False)
+
+
+class ProfileHook:
+    """
+    Runs a cProfile session while registered, so function-level hot spots
+    can be read alongside the stage records (which are kept in records).
+    Only the thread that registered the hook is profiled.
+    """
+
+    def __init__(self, profile=None):
+        """
+        :param profile: cProfile.Profile to feed (default: a new one)
+        """
+        import cProfile
+        self.profile = profile if profile is not None else cProfile.Profile()
+        self.records = []
+
+    def start(self):
+        self.profile.enable()
+
+    def stop(self):
+        self.profile.disable()
+
+    def __call__(self, record):
+        self.records.append(record)
+
+    def stats(self, sort='cumulative'):
+        """ pstats.Stats of the session, sorted by sort. """
+        import pstats
+        return pstats.Stats(self.profile).sort_stats(sort)
+
+
+class TracemallocHook:
+    """
+    Traces memory allocations with tracemalloc while registered, which fills
+    in the bytes of every stage record. A snapshot of the allocations still
+    alive when the hook is removed is kept in snapshot.
+    """
+
+    def __init__(self, nframes=1):
+        """
+        :param nframes: number of frames stored per traceback
+        """
+        self.nframes = nframes
+        self.snapshot = None
+        self._started = False
+
+    def start(self):
+        import tracemalloc
+        if not tracemalloc.is_tracing():
+            tracemalloc.start(self.nframes)
+            self._started = True
+
+    def stop(self):
+        import tracemalloc
+        self.snapshot = tracemalloc.take_snapshot()
+        if self._started:
+            tracemalloc.stop()
+            self._started = False
+
+    def __call__(self, record):
+        pass
@@ -1,5 +1,7 @@
-import matplotlib.pyplot as plt
-import seaborn as sns
+import os
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
 import pandas as pd
 
 def make_interaction_plot(y, x, z, title, saveFolder):
@@ -16,9 +18,14 @@ def make_interaction_plot(y, x, z, title, saveFolder):
     :param y: outcome variable (dataframe)
     :param x: predictor variable (dataframe)
     :param z: interaction variable - the variable to median split
-    :param title: title for plot
+    :param title: title for plot (also used in file name)
     :param saveFolder: full path for folder in which to save plots
     """
+    # plotting libraries are imported on first plot rather than with this
+    # module, so workers that only fit models or score start fast
+    import matplotlib.pyplot as plt
+    import seaborn as sns
+
     # Perform median split of z
     z_high = z[z >= z.median()].dropna()
     z_low = z[z < z.median()].dropna()
@@ -36,13 +43,213 @@ def make_interaction_plot(y, x, z, title, saveFolder):
     
     # plot values
     fig, ax = plt.subplots(1,1)
-    sns.regplot(x_low, y_low, x_ci ='ci', color='purple', marker='^',
+    sns.regplot(x=x_low, y=y_low, x_ci ='ci', color='purple', marker='^',
                 label='Low CR', ax=ax)
-    sns.regplot(x_high, y_high, x_ci ='ci', color='green', marker='o',
-                label='High CR', ax=ax).set_title(col)
+    sns.regplot(x=x_high, y=y_high, x_ci ='ci', color='green', marker='o',
+                label='High CR', ax=ax).set_title(title)
     ax.legend()
     
     # save figure
-    filePath = saveFolder + '\\' + 'interactionPlot_'+col+'.png'
+    filePath = os.path.join(saveFolder, 'interactionPlot_' + title + '.png')
     ax.get_figure().savefig(filePath)    
-    plt.clf()
\ No newline at end of file
+    plt.close(fig)
+
+def _as_series(data):
+    """ First column of a dataframe, or the series itself. """
+    return data.iloc[:, 0] if isinstance(data, pd.DataFrame) else data
+
+def _median_split_fits(y, x, Z):
+    """
+    Median splits every moderator in Z and fits a regression line of y on x
+    in each half, for all moderators at once.
+
+    :param y: numpy array of size p (outcome)
+    :param x: numpy array of size p (predictor)
+    :param Z: numpy array of size p * m (moderators)
+    :return fits: dict of numpy arrays of size m (median, n_low, n_high,
+                  slope_low, intercept_low, slope_high, intercept_high) and
+                  boolean arrays low, high of size p * m (group membership)
+    """
+    median = np.nanmedian(Z, axis=0)
+    with np.errstate(invalid='ignore'):
+        high = Z >= median
+        low = Z < median
+    xy_valid = (~np.isnan(x) & ~np.isnan(y)).astype(np.float64)
+    x0, y0 = np.nan_to_num(x) * xy_valid, np.nan_to_num(y) * xy_valid
+
+    # sums of x, y, x^2 and xy within each group with one matrix product
+    moments = np.stack([xy_valid, x0, y0, x0 * x0, x0 * y0])
+
+    fits = {'median': median, 'low': low, 'high': high}
+    for name, group in (('low', low), ('high', high)):
+        n, sx, sy, sxx, sxy = moments @ group
+        with np.errstate(invalid='ignore', divide='ignore'):
+            slope = (n * sxy - sx * sy) / (n * sxx - sx * sx)
+            intercept = (sy - slope * sx) / n
+        fits['n_' + name] = n.astype(np.int64)
+        fits['slope_' + name] = slope
+        fits['intercept_' + name] = intercept
+    return fits
+
+def _render_plots(y, x, labels, plots, saveFolder, dpi):
+    """
+    Renders a chunk of interaction plots with the Agg backend, reusing one
+    figure and axes for every plot. Run in a worker process.
+
+    :param plots: list of (title, low mask, high mask, slope_low,
+                  intercept_low, slope_high, intercept_high) tuples
+    :return paths: list of saved file paths
+    """
+    import matplotlib
+    matplotlib.use('Agg')
+    import matplotlib.pyplot as plt
+    import seaborn as sns
+
+    sns.set()
+    fig, ax = plt.subplots(1, 1)
+    x_line = np.array([np.nanmin(x), np.nanmax(x)])
+    paths = []
+    for title, low, high, slope_low, int_low, slope_high, int_high in plots:
+        ax.cla()
+        ax.scatter(x[low], y[low], color='purple', marker='^', label='Low CR')
+        ax.plot(x_line, int_low + slope_low * x_line, color='purple')
+        ax.scatter(x[high], y[high], color='green', marker='o',
+                   label='High CR')
+        ax.plot(x_line, int_high + slope_high * x_line, color='green')
+        ax.set_xlabel(labels[0])
+        ax.set_ylabel(labels[1])
+        ax.set_title(title)
+        ax.legend()
+
+        path = os.path.join(saveFolder, 'interactionPlot_' + title + '.png')
+        fig.savefig(path, dpi=dpi)
+        paths.append(path)
+    plt.close(fig)
+    return paths
+
+def make_interaction_plots(y, x, Z, saveFolder, n_workers=None,
+                           plots_per_task=50, dpi=100):
+    """ Creates interaction plots (as make_interaction_plot) for many
+        moderators at once, e.g. for every composite returned by
+        create_unique_combinations. y, x and Z are aligned once on their
+        shared index, median splits and regression lines for all moderators
+        are computed together with numpy, and plots are rendered headless
+        (Agg backend) across a process pool, each worker reusing one figure.
+        Note: regression lines are drawn without the bootstrapped confidence
+        bands of seaborn regplot. On Windows/macOS, call this function from
+        within an if __name__ == '__main__': block.
+
+    :param y: outcome variable (dataframe or series)
+    :param x: predictor variable (dataframe or series)
+    :param Z: dataframe with one column per interaction variable (each one is
+              median split). Column names are used as plot titles.
+    :param saveFolder: full path for folder in which to save plots
+    :param n_workers: number of worker processes (default = number of CPUs)
+    :param plots_per_task: number of plots rendered per task
+    :param dpi: resolution of saved plots
+    :return fits: dataframe (one row per moderator) with median of moderator,
+                  number of participants, slope and intercept of the
+                  regression line in the low and high groups, and path of
+                  the saved plot
+    """
+    y, x = _as_series(y), _as_series(x)
+    index = y.index.intersection(x.index).intersection(Z.index)
+    y_values = y.reindex(index).to_numpy(dtype=np.float64)
+    x_values = x.reindex(index).to_numpy(dtype=np.float64)
+    fits = _median_split_fits(y_values, x_values,
+                              Z.reindex(index).to_numpy(dtype=np.float64))
+
+    titles = [str(col) for col in Z.columns]
+    plots = [(title, fits['low'][:, j], fits['high'][:, j],
+              fits['slope_low'][j], fits['intercept_low'][j],
+              fits['slope_high'][j], fits['intercept_high'][j])
+             for j, title in enumerate(titles)]
+    labels = (str(x.name), str(y.name))
+
+    with ProcessPoolExecutor(max_workers=n_workers) as pool:
+        tasks = [pool.submit(_render_plots, y_values, x_values, labels,
+                             plots[start:start + plots_per_task], saveFolder,
+                             dpi)
+                 for start in range(0, len(plots), plots_per_task)]
+        paths = [path for task in tasks for path in task.result()]
+
+    return pd.DataFrame({
+        'median': fits['median'],
+        'n_low': fits['n_low'],
+        'n_high': fits['n_high'],
+        'slope_low': fits['slope_low'],
+        'intercept_low': fits['intercept_low'],
+        'slope_high': fits['slope_high'],
+        'intercept_high': fits['intercept_high'],
+        'path': paths,
+        }, index=pd.Index(titles, name='moderator'))
+
+def fit_moderation_models(y, x, Z):
+    """ Fits the moderation regression Y ~ X + Z + X*Z for every moderator
+        in Z at once (e.g. every composite returned by
+        create_unique_combinations), i.e. the models illustrated by
+        make_interaction_plot. Each model uses the participants with no
+        missing y, x or z. The cross products of all design matrices are
+        built with a few matrix products and all models are solved together
+        with batched least squares.
+
+    :param y: outcome variable (dataframe or series)
+    :param x: predictor variable (dataframe or series)
+    :param Z: dataframe with one column per interaction variable
+    :return models: dataframe (one row per moderator) with number of
+                    participants (n), R-squared (r2) and, for each term
+                    (const, x, z, xz = interaction), the coefficient
+                    (coef_<term>), standard error (se_<term>), t statistic
+                    (t_<term>) and two-sided p-value (p_<term>)
+    """
+    from scipy import stats
+
+    y, x = _as_series(y), _as_series(x)
+    index = y.index.intersection(x.index).intersection(Z.index)
+    y = y.reindex(index).to_numpy(dtype=np.float64)
+    x = x.reindex(index).to_numpy(dtype=np.float64)
+    z = Z.reindex(index).to_numpy(dtype=np.float64)
+
+    # valid rows per model, with missing values set to 0
+    valid = ~np.isnan(z) & (~np.isnan(x) & ~np.isnan(y))[:, None]
+    z = np.where(valid, z, 0.0)
+    x, y = np.nan_to_num(x), np.nan_to_num(y)
+
+    # sums of x^a * y^c * z^b over valid rows for every model:
+    # S[b][row of A] = A @ (z^b masked)
+    A = np.stack([np.ones_like(x), x, x * x, y, x * y, y * y])
+    S = [A @ valid.astype(np.float64), A @ z, A @ (z * z)]
+    one, xs, x2, ys, xy, y2 = range(6)
+
+    # X'X and X'y for design [1, x, z, xz] of every model (m * 4 * 4)
+    XtX = np.stack([
+        np.stack([S[0][one], S[0][xs], S[1][one], S[1][xs]], axis=-1),
+        np.stack([S[0][xs], S[0][x2], S[1][xs], S[1][x2]], axis=-1),
+        np.stack([S[1][one], S[1][xs], S[2][one], S[2][xs]], axis=-1),
+        np.stack([S[1][xs], S[1][x2], S[2][xs], S[2][x2]], axis=-1),
+        ], axis=1)
+    Xty = np.stack([S[0][ys], S[0][xy], S[1][ys], S[1][xy]], axis=-1)
+
+    n = S[0][one]
+    XtX_inv = np.linalg.pinv(XtX)
+    coef = np.einsum('mij,mj->mi', XtX_inv, Xty)
+    rss = S[0][y2] - np.einsum('mi,mi->m', coef, Xty)
+    tss = S[0][y2] - S[0][ys]**2 / n
+    dof = n - 4
+    with np.errstate(invalid='ignore', divide='ignore'):
+        sigma2 = rss / dof
+        se = np.sqrt(sigma2[:, None] *
+                     np.diagonal(XtX_inv, axis1=1, axis2=2))
+        t = coef / se
+    p = 2 * stats.t.sf(np.abs(t), dof[:, None])
+
+    models = pd.DataFrame({'n': n.astype(np.int64), 'r2': 1 - rss / tss},
+                          index=pd.Index([str(col) for col in Z.columns],
+                                         name='moderator'))
+    for j, term in enumerate(['const', 'x', 'z', 'xz']):
+        models['coef_' + term] = coef[:, j]
+        models['se_' + term] = se[:, j]
+        models['t_' + term] = t[:, j]
+        models['p_' + term] = p[:, j]
+
+    return models
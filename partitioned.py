@@ -0,0 +1,281 @@
+"""
+Out-of-core backend for cohorts that do not fit in memory. The scorers and
+the composite generator are run partition by partition on either:
+    - a partitioned Parquet dataset (a directory, a file, a list of files or
+      a pyarrow dataset), read one file - and optionally one batch of rows -
+      at a time with pyarrow and processed in a local process pool, or
+    - a Dask DataFrame, processed with map_partitions on whatever cluster
+      Dask is connected to (e.g. a dask.distributed LocalCluster of worker
+      processes).
+Scores and composites are row-wise, so scoring each partition separately
+gives the same result as scoring the whole cohort at once.
+
+Requires pyarrow (and dask for Dask DataFrame input).
+"""
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+import pandas as pd
+
+from create_cogRes_composites import (ParquetSink, create_unique_combinations,
+                                      standardise, write_composites)
+from scoring_utils import SCORERS, score_frame
+
+
+def _is_dask(source):
+    """ True if source is a Dask DataFrame (checked without importing dask). """
+    return hasattr(source, 'map_partitions') and hasattr(source, 'npartitions')
+
+
+def parquet_files(source):
+    """
+    Lists the Parquet files of a partitioned dataset.
+
+    :param source: directory (searched recursively, e.g. the output of
+                   score_files), single .parquet file, list of files or
+                   pyarrow dataset
+    :return files: list of file paths
+    """
+    if hasattr(source, 'files'):
+        return list(source.files)
+    if isinstance(source, (str, os.PathLike)):
+        import pyarrow.dataset as ds
+        return list(ds.dataset(source, format='parquet').files)
+    return [os.fspath(path) for path in source]
+
+
+def _range_index(parquet):
+    """ RangeIndex that pandas stored as metadata (not as a column) in a
+    Parquet file, as a dict with name, start and step - or None. """
+    metadata = parquet.schema_arrow.pandas_metadata or {}
+    for index in metadata.get('index_columns', []):
+        if isinstance(index, dict) and index.get('kind') == 'range':
+            return index
+    return None
+
+
+def iter_partitions(source, columns=None, batch_rows=None, index_col=None):
+    """
+    Yields a partitioned Parquet dataset as pandas dataframes, one file (or,
+    with batch_rows, one batch of at most batch_rows rows) at a time, so
+    memory use is bounded by the partition size.
+
+    :param source: see parquet_files
+    :param columns: columns to read (default = all)
+    :param batch_rows: maximum number of rows per dataframe (default = one
+                       dataframe per file)
+    :param index_col: column to use as the index (e.g. 'subid')
+    :return: generator of pandas dataframes
+    """
+    import pyarrow.parquet as pq
+
+    if columns is not None and index_col is not None and \
+            index_col not in columns:
+        columns = [index_col] + list(columns)
+    for path in parquet_files(source):
+        parquet = pq.ParquetFile(path)
+        if batch_rows:
+            batches = parquet.iter_batches(batch_size=batch_rows,
+                                           columns=columns)
+        else:
+            batches = [parquet.read(columns=columns)]
+        # a RangeIndex stored as metadata restarts in every batch - offset it
+        range_index = _range_index(parquet) if batch_rows else None
+        offset = 0
+        for batch in batches:
+            data = batch.to_pandas()
+            if range_index is not None:
+                step = range_index['step']
+                start = range_index['start'] + offset * step
+                data.index = pd.RangeIndex(start, start + len(data) * step,
+                                           step, name=range_index['name'])
+            offset += len(data)
+            if index_col is not None:
+                data = data.set_index(index_col)
+            yield data
+
+
+def _score_parquet_file(path, out_path, questionnaire, subid, batch_rows):
+    """
+    Scores one Parquet file batch by batch into out_path. Run in a worker
+    process.
+    """
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+
+    start = time.perf_counter()
+    writer = None
+    rows = 0
+    try:
+        for data in iter_partitions([path], batch_rows=batch_rows):
+            scored = score_frame(data, questionnaire, subid)
+            table = pa.Table.from_pandas(scored, preserve_index=False)
+            if writer is None:
+                writer = pq.ParquetWriter(out_path, table.schema)
+            writer.write_table(table)
+            rows += len(scored)
+    finally:
+        if writer is not None:
+            writer.close()
+
+    return {'path': path, 'rows': rows,
+            'seconds': time.perf_counter() - start}
+
+
+def score_partitioned(questionnaire, source, out_dir=None, n_workers=None,
+                      subid='subid', batch_rows=None, verbose=True):
+    """
+    Scores a cohort that does not fit in memory partition by partition.
+
+    With a Parquet dataset, each file is scored in its own worker process
+    (batch_rows rows at a time) and written to out_dir/part-<n>.parquet.
+    With a Dask DataFrame, the scorer is mapped over its partitions and the
+    (lazy) result is returned, after being written to out_dir if given.
+
+    :param questionnaire: 'CRIq', 'IPAQ', 'CSAQ' or 'SNI'
+    :param source: Dask DataFrame, or Parquet dataset (see parquet_files)
+    :param out_dir: folder of the scored Parquet dataset (required for
+                    Parquet input)
+    :param n_workers: number of worker processes for Parquet input (default:
+                      number of CPUs)
+    :param subid: name of the subject id column
+    :param batch_rows: maximum rows scored at once per Parquet file (default
+                       = whole file)
+    :param verbose: Flag to print timing and row count of each file
+    :return scored: Dask DataFrame of scores (Dask input), or dataframe with
+                    rows and seconds of each input file (Parquet input)
+    """
+    if questionnaire not in SCORERS:
+        raise ValueError('questionnaire must be one of %s'
+                         % ', '.join(SCORERS))
+
+    if _is_dask(source):
+        scored = source.map_partitions(
+                score_frame, questionnaire, subid,
+                meta=score_frame(source._meta, questionnaire, subid))
+        if out_dir is not None:
+            scored.to_parquet(out_dir, write_index=False)
+        return scored
+
+    if out_dir is None:
+        raise ValueError('out_dir is required for Parquet input')
+    files = parquet_files(source)
+    os.makedirs(out_dir, exist_ok=True)
+
+    start = time.perf_counter()
+    with ProcessPoolExecutor(max_workers=n_workers) as pool:
+        futures = [pool.submit(_score_parquet_file, path,
+                               os.path.join(out_dir, 'part-%05d.parquet' % i),
+                               questionnaire, subid, batch_rows)
+                   for i, path in enumerate(files)]
+        stats = []
+        for future in futures:
+            result = future.result()
+            stats.append(result)
+            if verbose:
+                print('%-40s %10d rows %8.2f s'
+                      % (result['path'], result['rows'], result['seconds']))
+    stats = pd.DataFrame(stats, columns=['path', 'rows', 'seconds']) \
+        .set_index('path')
+
+    if verbose:
+        seconds = time.perf_counter() - start
+        print('Scored %d files, %d rows in %.1f s (%.0f rows/s)'
+              % (len(stats), stats['rows'].sum(), seconds,
+                 stats['rows'].sum() / seconds))
+
+    return stats
+
+
+def _composite_partition(data, stats=None):
+    """ Composites of one in-memory partition (standardised with stats
+    first if given). """
+    if stats is not None:
+        data = standardise(data, stats)
+    return create_unique_combinations(data)
+
+
+def _composites_parquet_file(path, out_prefix, index_col, stats, batch_rows,
+                             subsets_per_block):
+    """
+    Writes the composites of one Parquet file, batch by batch, to
+    out_prefix-<batch>.parquet. Run in a worker process.
+    """
+    start = time.perf_counter()
+    rows = 0
+    for i, data in enumerate(iter_partitions([path], batch_rows=batch_rows,
+                                             index_col=index_col)):
+        if stats is not None:
+            data = standardise(data, stats)
+        write_composites(data, ParquetSink('%s-%05d.parquet' % (out_prefix, i),
+                                           index_name=data.index.name or
+                                           'subid'),
+                         subsets_per_block=subsets_per_block)
+        rows += len(data)
+
+    return {'path': path, 'rows': rows,
+            'seconds': time.perf_counter() - start}
+
+
+def write_composites_partitioned(source, out_dir=None, stats=None,
+                                 index_col=None, n_workers=None,
+                                 batch_rows=None, subsets_per_block=None,
+                                 verbose=True):
+    """
+    Writes every composite of the cognitive reserve proxies of a cohort that
+    does not fit in memory, partition by partition. Composites of each
+    partition are the same as those create_unique_combinations gives for the
+    whole cohort. To standardise the proxies over the whole cohort, compute
+    stats first with create_cogRes_composites.reference_stats(
+    iter_partitions(source, index_col=...)).
+
+    :param source: Dask DataFrame, or Parquet dataset (see parquet_files) of
+                   proxies (plus the subject id column)
+    :param out_dir: folder of the composite Parquet dataset (required for
+                    Parquet input)
+    :param stats: reference statistics (see reference_stats) used to
+                  standardise each partition before averaging, or None to use
+                  the proxies as they are
+    :param index_col: subject id column of Parquet input (default: the index
+                      stored in the files)
+    :param n_workers: number of worker processes for Parquet input (default:
+                      number of CPUs)
+    :param batch_rows: maximum rows per Parquet file processed at once
+                       (default = whole file)
+    :param subsets_per_block: composites computed at once within a batch
+                              (default = all)
+    :param verbose: Flag to print timing and row count of each file
+    :return composites: Dask DataFrame of composites (Dask input), or
+                        dataframe with rows and seconds of each input file
+                        (Parquet input)
+    """
+    if _is_dask(source):
+        composites = source.map_partitions(
+                _composite_partition, stats,
+                meta=_composite_partition(source._meta, stats))
+        if out_dir is not None:
+            composites.to_parquet(out_dir)
+        return composites
+
+    if out_dir is None:
+        raise ValueError('out_dir is required for Parquet input')
+    files = parquet_files(source)
+    os.makedirs(out_dir, exist_ok=True)
+
+    with ProcessPoolExecutor(max_workers=n_workers) as pool:
+        futures = [pool.submit(_composites_parquet_file, path,
+                               os.path.join(out_dir, 'part-%05d' % i),
+                               index_col, stats, batch_rows,
+                               subsets_per_block)
+                   for i, path in enumerate(files)]
+        timings = []
+        for future in futures:
+            result = future.result()
+            timings.append(result)
+            if verbose:
+                print('%-40s %10d rows %8.2f s'
+                      % (result['path'], result['rows'], result['seconds']))
+
+    return pd.DataFrame(timings, columns=['path', 'rows', 'seconds']) \
+        .set_index('path')
@@ -1,4 +1,93 @@
-def score_CRIq(df):
+import numpy as np
+import pandas as pd
+
+from instrumentation import stages
+from scoring_utils import ceil_to_multiple, item_block
+
+# version of the scoring rules - increase when a change alters scores (this
+# invalidates results cached by score_cache)
+SCORER_VERSION = 1
+
+# CRIq leisure time activities in the order of the pen and paper questionnaire
+# (weekly, monthly, annual and fixed frequency activities). Each activity has a
+# frequency item (named as the activity) and a years item ('<activity>_years').
+# For children the second item is the number of children ('children_number').
+CRIQ_LEISURE_ACTIVITIES = (
+    'newspapers', 'domestic_chores', 'driving', 'leisure_activities',
+    'new_technologies',
+    'social_activities', 'cinema_theatre', 'gardening_diy',
+    'grandchildren_care', 'volunteering', 'artistic_activities',
+    'exhibitions_concerts', 'journeys', 'reading_books',
+    'children', 'pet_care', 'bank_account')
+
+# Items (subid, age and CRIq responses) in the order of the pen and paper
+# questionnaire, i.e. the column order expected by score_CRIq
+CRIQ_ITEMS = (('subid', 'age', 'edu_school', 'edu_training') +
+              tuple('work_level%d' % level for level in range(1, 6)) +
+              sum([(activity, activity + '_number' if activity == 'children'
+                    else activity + '_years')
+                   for activity in CRIQ_LEISURE_ACTIVITIES], ()))
+
+# Items used to score each section of the CRIq
+CRIQ_SECTIONS = {
+    'age': ('age',),
+    'education': ('edu_school', 'edu_training'),
+    'working': tuple('work_level%d' % level for level in range(1, 6)),
+    'leisure_frequency': tuple(activity for activity in CRIQ_LEISURE_ACTIVITIES
+                               if activity != 'children'),
+    'leisure_years': tuple(activity + '_years'
+                           for activity in CRIQ_LEISURE_ACTIVITIES
+                           if activity != 'children'),
+    'children': ('children', 'children_number'),
+    }
+
+def _working_activity(work):
+    """
+    Gets the highest working activity score and the average of the other
+    working activity scores for each participant.
+    IF MORE THAN THREE WORKING ACTIVITY ENTRIES, THE LOWEST ENTRY IS DROPPED
+    FROM THE AVERAGE. THIS PUTS CODE IN LINE WITH EXCEL SCORING SHEET WHICH
+    ONLY ALLOWS 3 ENTRIES.
+
+    :param work: numpy array of size p * 5 with working activity scores
+                 (years * job level) where missing entries are NaN
+    :return max_working: numpy array with highest score per participant (NaN
+                         if participant has no entries)
+    :return avg_working: numpy array with average of other scores per
+                         participant (0 if participant has < 2 entries)
+    """
+    # sort scores for each ppt - NaNs are sorted to the end of each row
+    work = np.sort(work, axis=1)
+    n_entries = np.count_nonzero(~np.isnan(work), axis=1)
+
+    # max is the last non-NaN entry in each row
+    rows = np.arange(len(work))
+    max_working = work[rows, np.maximum(n_entries - 1, 0)]
+
+    # average entries below the max - drop the lowest entry when >= 3 are
+    # left (>= 3 used here because max entry already excluded)
+    n_rest = n_entries - 1
+    first = (n_rest >= 3).astype(np.intp)
+    positions = np.arange(work.shape[1])
+    keep = (positions >= first[:, None]) & (positions < n_rest[:, None])
+    rest_sum = np.where(keep, work, 0).sum(axis=1)
+    rest_count = np.count_nonzero(keep, axis=1)
+    avg_working = np.divide(rest_sum, rest_count,
+                            out=np.zeros_like(rest_sum), where=rest_count > 0)
+
+    return max_working, avg_working
+
+def _CRIq_columns(df, items=None):
+    """
+    Maps each CRIq item (CRIQ_ITEMS) to a column in df (see score_CRIq).
+    """
+    if items is not None:
+        return items
+    if set(CRIQ_ITEMS).issubset(df.columns):
+        return {item: item for item in CRIQ_ITEMS}
+    return dict(zip(CRIQ_ITEMS, df.columns))
+
+def score_CRIq(df, items=None):
     """
     Scores the Cognitive Reserve Index Questionnaire following the 
     instructions outlined in http://www.cognitivereserveindex.org/Nucci_et_al_12a.pdf
@@ -29,6 +118,12 @@ def score_CRIq(df):
                 Leisure Time responses must be coded as 0 (Never/Rarely) and
                 1 (Often/Always).
                 All missing data or NaN values should be set to equal 0.
+                df may contain other columns if items is given or if the
+                CRIq columns are named as in CRIQ_ITEMS. df is not modified.
+    :param items: dict mapping CRIq item names (see CRIQ_ITEMS) to column
+                names in df. If None, columns named as in CRIQ_ITEMS are
+                used if all are present, otherwise the first 43 columns of df
+                are taken in questionnaire order.
 
     :return CRIq_standardised: dataframe with CRIq scores with following 
                 columns:
@@ -38,26 +133,24 @@ def score_CRIq(df):
                     - Column 4 (CRIq_leisure) = leisure time subscore (standardised)
                     - Column 5 (CRIq_total) = total score (standardised)
     """
-    import pandas    
-    import math
-    import numpy
-    #%% 1) Prep dataframe
-    CRIq_raw = pd.DataFrame(columns=['subid', 'edu_raw', 'working_raw',
-                                     'leisure_raw'])
-    CRIq_standardised = pd.DataFrame(columns=['subid', 'edu', 'working',
-                                     'leisure', 'total'])
-    
-    CRIq_raw['subid'] = df.iloc[:,0]
-    CRIq_standardised['subid'] = df.iloc[:,0]
-          
-    # Check for any participants with 0s in raw questionnaire answers
-    df.set_index('subid', inplace=True)
-    zero_rows = (df==0).all(axis=1)  # retain for end to replace final scores
-    df.reset_index(inplace=True)     # with NaNs for ppts without answers
+    stage = stages('score_CRIq', len(df))
+
+    #%% 1) Get CRIq sections
+    items = _CRIq_columns(df, items)
+    sections = {
+        section: item_block(df, [items[item] for item in section_items])
+        for section, section_items in CRIQ_SECTIONS.items()}
+    age = sections['age'][:, 0]
+
+    # Check for any participants with 0s in raw questionnaire answers - retain
+    # for end to replace final scores with NaNs for ppts without answers
+    zero_rows = np.logical_and.reduce(
+            [(block == 0).all(axis=1) for block in sections.values()])
+    stage('read')
     
     #%% 2) Get edu subscores
     # "raw score of this section is the sum of these two values"
-    CRIq_raw['edu_raw'] = df.iloc[:, 2:4].sum(axis=1)
+    edu_raw = np.nansum(sections['education'], axis=1)
     
     # preset coefficients (from CRIq scoring spreadsheet)
     edu_intercept = 21.1691293
@@ -65,59 +158,33 @@ def score_CRIq(df):
     edu_std = 4.749805
     
     # get expected values for age
-    expected_edu = (df['age']*edu_slope) + edu_intercept
+    expected_edu = (age*edu_slope) + edu_intercept
     
     # calculate edu residual
-    edu_residual = (CRIq_raw['edu_raw'] - expected_edu) / edu_std
+    edu_residual = (edu_raw - expected_edu) / edu_std
 
     # scale
-    CRIq_standardised['edu'] = (edu_residual * 15)+100
+    edu = (edu_residual * 15)+100
+    stage('edu')
         
     #%% 2) Calculate working activity subscore      
+    work = sections['working']
+
     # round values up to nearest 5 (as instructed in paper scale)
-    def roundup(x):
-        return int(math.ceil(x / 5)) * 5   
-    df.iloc[:, 4:9] = df.iloc[:, 4:9].applymap(roundup)
+    ceil_to_multiple(work, 5, out=work)
     
     # multiply years by job level
-    for level in range(1,6):
-        ix = level+3
-        df.iloc[:, ix] = df.iloc[:, ix] * level
+    work *= np.arange(1, 6)
         
     # set zeros to nan
-    df.iloc[:, 4:9] = df.iloc[:, 4:9].replace(0, np.nan)
+    work[work == 0] = np.nan
     
-    # get max working activity score for each ppt and save in separate series
-    max_working = df.iloc[:, 4:9].max(axis=1)
-    
-    # get index of max
-    max_ix = df.iloc[:, 4:9].idxmax(axis=1)
-
-    # loop through df and get average of other scores (without max score)
-    avg_working = pd.Series(index=max_working.index)
-    
-    for row in range(len(max_ix)):
-        # get all working activity responses for ppt in row
-        all_work = df.iloc[row, 4:9]
-
-        # replace max value with nan
-        all_work[max_ix.iloc[row]] = np.nan
-        
-        # IF MORE THAN THREE WORKING ACTIVITY ENTRIES, DROP LOWEST ENTRY
-        # THIS PUTS CODE IN LINE WITH EXCEL SCORING SHEET WHICH ONLY ALLOWS
-        # 3 ENTRIES. >= 3 used in this code here because max entry already set to NaN
-        if all_work.count() >= 3:
-            all_work[all_work.idxmin()] = np.nan
-
-        # get mean working activity score without the max value
-        avg_working[row] = all_work.mean()
-     
-    # replace avg_working nans with zeros to enable sum in next step
-    avg_working.replace(np.nan, 0, inplace=True)
+    # get max working activity score and average of other scores for each ppt
+    max_working, avg_working = _working_activity(work)
     
     # add highest value for working activity score to average of other working
     # activity values
-    CRIq_raw['working_raw'] = max_working + avg_working
+    working_raw = max_working + avg_working
            
     # preset coefficients (from CRIq scoring spreadsheet)
     working_intercept = -2.082
@@ -125,41 +192,35 @@ def score_CRIq(df):
     working_std = 40.21979
     
     # get expected values for age
-    expected_working = (df['age']*working_slope + working_intercept)
+    expected_working = (age*working_slope + working_intercept)
     
     # calculate working activity residual
-    working_residual = (CRIq_raw['working_raw'] - expected_working) / working_std
+    working_residual = (working_raw - expected_working) / working_std
 
     # scale
-    CRIq_standardised['working'] = (working_residual * 15)+100
+    working = (working_residual * 15)+100
+    stage('working')
      
     #%% 3) Calculate leisure time subscore
-    # get leisure activity columns (i.e. all leisure responses
-    # except for question on children) and children responses separately
-    activity_cols = list(range(9,37)) + list(range(39,43))
-    leisure_activity = df.iloc[:, activity_cols]
-    children = df.iloc[:, 37:39]
-
-    # get frequency columns and year columns separately
-    leisure_freq = leisure_activity[leisure_activity.columns[::2]]
-    leisure_years = leisure_activity[leisure_activity.columns[1::2]]
+    # leisure activity frequency and years (i.e. all leisure responses except
+    # for question on children)
+    leisure_years = sections['leisure_years']
 
     # round up all leisure activity years columns by 5
-    leisure_years = leisure_years.applymap(roundup)
+    ceil_to_multiple(leisure_years, 5, out=leisure_years)
     
     # get raw leisure activity score (multiply frequency by years for each q)
-    leisure_activity_raw = pd.DataFrame(leisure_years.values * 
-                                        leisure_freq.values, 
-                                        columns=leisure_freq.columns).sum(axis=1)
+    leisure_years *= sections['leisure_frequency']
+    leisure_activity_raw = np.nansum(leisure_years, axis=1)
+    stage('leisure')
        
-    # get children columns
     # get score for children (multiply number of children by 5 and then add 10)
-    children_raw = (children.iloc[:,1] * 5) + 10
+    children_raw = (sections['children'][:, 1] * 5) + 10
     
     # no children = score of 0 
-    children_raw.replace(10, 0, inplace=True)
+    children_raw[children_raw == 10] = 0
     
-    CRIq_raw['leisure_raw'] = leisure_activity_raw + children_raw
+    leisure_raw = leisure_activity_raw + children_raw
     
     # preset coefficients (from CRIq scoring spreadsheet)
     leisure_intercept = 2.68
@@ -167,32 +228,37 @@ def score_CRIq(df):
     leisure_std = 80.24101
     
     # get expected values for age
-    expected_leisure = (df['age']*leisure_slope) + leisure_intercept
+    expected_leisure = (age*leisure_slope) + leisure_intercept
     
     # calculate leisure residual
-    leisure_residual = (CRIq_raw['leisure_raw'] - expected_leisure) / leisure_std
+    leisure_residual = (leisure_raw - expected_leisure) / leisure_std
 
     # scale
-    CRIq_standardised['leisure'] = (leisure_residual * 15)+100
+    leisure = (leisure_residual * 15)+100
+    stage('children')
     
     #%% 4) Calculate total CRIq score
     # replace nans with zeros to account for scores of zero (e.g. in working 
     # activity)
-    CRIq_standardised.replace(np.nan, 0, inplace=True)
+    subscores = np.nan_to_num(np.column_stack([edu, working, leisure]),
+                              nan=0.0)
     
     # get avg of three subscores
-    CRIq_standardised['total'] = CRIq_standardised.iloc[:, 1:4].mean(axis=1)
+    total = subscores.mean(axis=1)
     
     # scale total score
-    CRIq_standardised['total'] = ((((CRIq_standardised['total']-100)/11.32277)*15)+100)
+    total = ((((total-100)/11.32277)*15)+100)
     
     #%% 5) Set values for any participants who didn't answer questionnaire (e.g.
     # answers were all zero) to NaN - if this is skipped, they will still be 
     # given a score despite not answering questionnaire
+    scores = np.column_stack([subscores, total])
+    scores[zero_rows] = np.nan
     
-    # Replace scores for these participants with NaNs in final CRIq scores
-    CRIq_standardised.set_index('subid', inplace=True)
-    CRIq_standardised[zero_rows] = np.nan
-    CRIq_standardised.reset_index(inplace=True)
+    CRIq_standardised = pd.DataFrame(scores,
+                                     columns=['edu', 'working', 'leisure',
+                                              'total'])
+    CRIq_standardised.insert(0, 'subid', df[items['subid']].to_numpy())
+    stage('total')
     
     return CRIq_standardised
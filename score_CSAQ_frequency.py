@@ -1,4 +1,43 @@
-def score_CSAQ_frequency(data):    
+import os
+
+import numpy as np
+import pandas as pd
+
+from instrumentation import stages
+from scoring_utils import item_block
+
+# version of the scoring rules - increase when a change alters scores (this
+# invalidates results cached by score_cache)
+SCORER_VERSION = 1
+
+# CSAQ questions 1 through 26
+CSAQ_ITEMS = tuple('BL_CSAQ_%03d' % q for q in range(1, 27))
+
+# items summed at each timepoint (question 16 is not scored)
+CSAQ_TIMEPOINTS = (('part_A_6', CSAQ_ITEMS[0:3]),
+                   ('part_B_12', CSAQ_ITEMS[3:9]),
+                   ('part_C_18', CSAQ_ITEMS[9:15]),
+                   ('part_D_40', CSAQ_ITEMS[16:21]),
+                   ('part_E_present', CSAQ_ITEMS[21:26]))
+
+def _index_plan(timepoints):
+    """
+    Compiles the item to timepoint mapping into the order items are read in
+    (grouped by timepoint) and the integer offset at which each timepoint
+    starts, so that all timepoint sums come from one np.add.reduceat call.
+
+    :param timepoints: sequence of (timepoint name, items) pairs
+    :return labels: list of items grouped by timepoint
+    :return offsets: int numpy array of the first position of each timepoint
+    """
+    labels = [item for _, items in timepoints for item in items]
+    sizes = [len(items) for _, items in timepoints]
+    offsets = np.concatenate(([0], np.cumsum(sizes[:-1]))).astype(np.intp)
+    return labels, offsets
+
+_LABELS, _OFFSETS = _index_plan(CSAQ_TIMEPOINTS)
+
+def score_CSAQ_frequency(data, index_col=None):    
     r"""
     
     Scores the frequency data from Wilson et al (2003) Cognitively Stimulating 
@@ -9,9 +48,15 @@ def score_CSAQ_frequency(data):
     
     Parameters
     ----------
-    data : dataframe
+    data : dataframe, pyarrow Table or str
         Dataframe containing responses for CSAQ questions 1 through 26. Index should contain
-        subid.
+        subid. A pyarrow Table or the path of a .parquet file is also accepted and
+        is scored without building a dataframe of the responses (only the scored
+        items are read from parquet). Columns are addressed by name, so their
+        order does not matter. Missing responses give NaN scores.
+    index_col : str, optional
+        Column holding the subid, used as the index of csaq_freq. By default the
+        index of data is used (a RangeIndex for Arrow/Parquet input).
 
     Returns
     -------
@@ -24,34 +69,38 @@ def score_CSAQ_frequency(data):
     -----
     Author: Rory Boyle
     Email: rorytboyle@gmail.com
-    Requires: pandas
+    Requires: numpy, pandas (pyarrow for Arrow/Parquet input)
     Date created: 15/07/2020
     """
 
-    # init df
-    csaq_freq = pd.DataFrame()
-    
-    # score total freq at age 6
-    csaq_freq['part_A_6'] = data[['BL_CSAQ_001', 'BL_CSAQ_002', 'BL_CSAQ_003']].sum(
-            axis=1, skipna=False) 
-    
-    # score total freq at age 12
-    csaq_freq['part_B_12'] = data.loc[:, 'BL_CSAQ_004':'BL_CSAQ_009'].sum(
-            axis=1, skipna=False)
-    
-    # score total freq at age 18    
-    csaq_freq['part_C_18'] = data.loc[:, 'BL_CSAQ_010':'BL_CSAQ_015'].sum(
-            axis=1, skipna=False)
-    
-    # score total freq at age 40  
-    csaq_freq['part_D_40'] = data.loc[:, 'BL_CSAQ_017':'BL_CSAQ_021'].sum(
-            axis=1, skipna=False)
-    
-    # score present
-    csaq_freq['part_E_present'] = data.loc[:,'BL_CSAQ_022':'BL_CSAQ_026'].sum(
-            axis=1, skipna=False)
-    
+    # read straight from parquet/arrow - only the scored items (and subid)
+    if isinstance(data, (str, os.PathLike)):
+        import pyarrow.parquet as pq
+        data = pq.read_table(data, columns=_LABELS + (
+                [index_col] if index_col is not None else []))
+
+    stage = stages('score_CSAQ_frequency', len(data))
+    if index_col is not None:
+        index = pd.Index(np.asarray(data[index_col]), name=index_col)
+    elif isinstance(data, pd.DataFrame):
+        index = data.index
+    else:
+        index = pd.RangeIndex(len(data))
+
+    # all timepoint sums in one reduction - NaN propagates as with
+    # sum(skipna=False)
+    block = item_block(data, _LABELS)
+    stage('read')
+    scores = np.empty((len(index), len(CSAQ_TIMEPOINTS) + 1))
+    np.add.reduceat(block, _OFFSETS, axis=1, out=scores[:, :-1])
+    stage('timepoints')
+
     # score total across all timepoints
-    csaq_freq['total'] = csaq_freq.loc[:, 'part_A_6':'part_E_present'].sum(axis=1, skipna=False)
-    
-    return csaq_freq
\ No newline at end of file
+    scores[:, -1] = scores[:, :-1].sum(axis=1)
+
+    csaq_freq = pd.DataFrame(scores, index=index, copy=False,
+                             columns=[name for name, _ in CSAQ_TIMEPOINTS] +
+                             ['total'])
+    stage('total')
+
+    return csaq_freq
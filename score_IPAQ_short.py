@@ -1,6 +1,90 @@
+import time
+
 import pandas as pd
 import numpy as np
 
+from instrumentation import stages
+
+# version of the scoring rules - increase when a change alters scores (this
+# invalidates results cached by score_cache)
+SCORER_VERSION = 1
+
+
+def _score_IPAQ_items(items, truncate=True, stage=None):
+    """
+    Scores the IPAQ Short Form for all participants in one pass over the 10
+    IPAQ items (see score_IPAQ_short for the scoring protocol).
+
+    :param items: numpy array of size p * 10 with Q1 to Q7 responses in the
+                  same order as columns 2 to 11 of score_IPAQ_short input
+    :param truncate: Flag to choose whether time values above 180 mins for a
+                     single category should be truncated to 180 mins.
+    :param stage: stage marker (see instrumentation.stages) of the caller
+    :return scores: dict of numpy arrays with the scored IPAQ columns (all
+                    columns returned by score_IPAQ_short except subid)
+    """
+    if stage is None:
+        stage = stages('_score_IPAQ_items', len(items))
+
+    # replace any nan values with 0
+    items = np.nan_to_num(items, nan=0.0)
+
+    # days, hours and mins for vigorous, moderate and walking activity
+    days = items[:, [0, 3, 6]]
+
+    # convert hours + mins into mins only
+    mins = items[:, [1, 4, 7]] * 60
+    mins += items[:, [2, 5, 8]]
+
+    # truncate unless user specifies not to
+    # if value in any one category > 180, replace with 180, else retain original
+    if truncate:
+        np.minimum(mins, 180, out=mins)
+
+    # calculate total time spent in each category = mins * days
+    weekly_time = np.multiply(mins, days, out=mins)
+    total_time = weekly_time.sum(axis=1)
+    stage('time')
+
+    # calculate metabolic minutes for each category
+    # vigorous met p/w = 8 * vigorous time
+    # moderate met p/w = 4 * moderate time
+    # walking met p/w = 3.3 * walking time
+    met = weekly_time * np.array([8, 4, 3.3])
+    total_met = met.sum(axis=1)
+    stage('met')
+
+    # get categorical variables
+    # high category
+    # a) 3+ days of vigorous activity  w/ total met mins <= 1500
+    high = ((days[:, 0] >= 3) & (total_time >= 1500)) | (
+    # OR b) 7 days of any activity w/ total met mins <= 3000
+            (days[:, 0] >= 7) & (total_time >= 3000))
+
+    # moderate category
+    # a) 3+ days of <= 20 mins of vigorous activity per day
+    mod = ((days[:, 1] >= 3) & (weekly_time[:, 0] >= 20)) | (
+    # OR b) 5+ days of <= 30 mins of moderate and/or walking activity
+            (days[:, 1] >= 5) &
+            ((weekly_time[:, 1] + weekly_time[:, 2]) >= 30)) | (
+    # OR c) 5+ days of any activity w/ total met mins >= 600    
+            (days[:, 1] >= 5) & (total_met >= 600))
+
+    return {
+        'vigorousTime': weekly_time[:, 0],
+        'moderateTime': weekly_time[:, 1],
+        'walkingTime': weekly_time[:, 2],
+        'totalTime': total_time,
+        # mark any cases with total time > 960 mins as an outlier
+        'outlier': np.where(total_time > 960, 'Yes', 'No'),
+        'vigorousMET': met[:, 0],
+        'moderateMET': met[:, 1],
+        'walkingMET': met[:, 2],
+        'totalMET': total_met,
+        # assign categories --> low = if not in vigorous or moderate categories
+        'category': np.where(high, 'High', np.where(mod, 'Moderate', 'Low')),
+        }
+
 
 def score_IPAQ_short(IPAQ_data, truncate=True, save_csv=False):
     """
@@ -43,6 +127,7 @@ def score_IPAQ_short(IPAQ_data, truncate=True, save_csv=False):
                      180 mins.
     :param save_csv: Flag to specify whether to save dataframe as a csv in.
                      Will be saved in the current working directory.
+                     Note: IPAQ_data is not modified.
     :return IPAQ_scored: dataframe with following columns:
                     - Column 1 = subject ids
                     - Column 2 = total mins of vigorous activity per week
@@ -62,77 +147,79 @@ def score_IPAQ_short(IPAQ_data, truncate=True, save_csv=False):
         data = IPAQ_data
     else:
         data = pd.read_csv(IPAQ_data)
+    stage = stages('score_IPAQ_short', len(data))
 
-    # replace any nan values with 0
-    data.replace(np.nan, 0, inplace=True)
+    # score all participants at once from the 10 IPAQ items
+    items = data.iloc[:, 1:11].to_numpy(dtype=np.float64)
+    stage('read')
+    scores = _score_IPAQ_items(items, truncate, stage)
+    stage('category')
 
     # set up dataframe to be returned
-    scored_data = pd.DataFrame()
-    scored_data['subid'] = data.iloc[:, 0]  # add subids to new df
-
-    # convert hours + mins into mins only
-    data['vigorousMins'] = (data.iloc[:, 2] * 60) + data.iloc[:, 3]
-    data['moderateMins'] = (data.iloc[:, 5] * 60) + data.iloc[:, 6]
-    data['walkingMins'] = (data.iloc[:, 8] * 60) + data.iloc[:, 9]
-
-    # truncate unless user specifies not to
-    # if value in any one column > 180, replace with 180, else retain original
-    if truncate:
-        data[['vigorousMins', 'moderateMins',
-              'walkingMins']] = np.where(data[['vigorousMins', 'moderateMins',
-                                               'walkingMins']] > 180, 180,
-                                         data[['vigorousMins',
-                                               'moderateMins', 'walkingMins']])
-
-    # calculate total time spent in each category = mins * days
-    scored_data['vigorousTime'] = data['vigorousMins'] * data.iloc[:, 1]
-    scored_data['moderateTime'] = data['moderateMins'] * data.iloc[:, 4]
-    scored_data['walkingTime'] = data['walkingMins'] * data.iloc[:, 7]
-    scored_data['totalTime'] = scored_data[
-            ['vigorousTime', 'moderateTime', 'walkingTime']].sum(
-            axis=1)
-
-    # mark any cases with total time > 960 mins as an outlier
-    scored_data['outlier'] = np.where(scored_data['totalTime'] > 960,
-                                      'Yes', 'No')
-
-    # calculate metabolic minutes for each category
-    # vigorous met p/w = 8 * vigorous time
-    scored_data['vigorousMET'] = 8 * scored_data['vigorousTime']
-
-    # moderate met p/w = 4.4 * moderate time
-    scored_data['moderateMET'] = 4 * scored_data['moderateTime']
-
-    # walking met p/w = 3.3 * walking time
-    scored_data['walkingMET'] = 3.3 * scored_data['walkingTime']
-
-    # total met p/w
-    scored_data['totalMET'] = scored_data[['vigorousMET', 'moderateMET',
-                                           'walkingMET']].sum(axis=1)
-
-    # get categorical variables
-    # high category
-    # a) 3+ days of vigorous activity  w/ total met mins <= 1500
-    high = ((data.iloc[:, 1] >= 3) & (scored_data['totalTime'] >= 1500)) | (
-    # OR b) 7 days of any activity w/ total met mins <= 3000
-            (data.iloc[:, 1] >= 7) & (scored_data['totalTime'] >= 3000))
-
-    # moderate category
-    # a) 3+ days of <= 20 mins of vigorous activity per day
-    mod = ((data.iloc[:, 4] >= 3) & (scored_data['vigorousTime'] >= 20)) | (
-    # OR b) 5+ days of <= 30 mins of moderate and/or walking activity
-            (data.iloc[:, 4] >= 5) & (scored_data[
-                    ['moderateTime', 'walkingTime']].sum(axis=1) >= 30)) | (
-    # OR c) 5+ days of any activity w/ total met mins >= 600    
-            (data.iloc[:, 4] >= 5) & (scored_data['totalMET'] >= 600))
-
-
-    # assign categories --> low = if not in vigorous or moderate categories
-    scored_data['category'] = np.where(high, 'High',
-               (np.where(mod, 'Moderate', 'Low')))
+    scored_data = pd.DataFrame(scores, index=data.index)
+    scored_data.insert(0, 'subid', data.iloc[:, 0])  # add subids to new df
+    stage('frame')
                
     # save csv if specified by user
     if save_csv:
         scored_data.to_csv('IPAQ_scored.csv')
 
     return scored_data
+
+
+def score_IPAQ_short_csv(csv_path, out_path='IPAQ_scored.csv', truncate=True,
+                         chunksize=100000, verbose=True):
+    """
+    Scores an IPAQ Short Form csv file that is too large to read at once. The
+    file is read in chunks of chunksize rows (subids read as strings, items
+    as float64), each chunk is scored with score_IPAQ_short and appended to
+    out_path, so memory use depends on chunksize rather than on the size of
+    the file. Subids are written as strings.
+
+    :param csv_path: csv file with columns as described in score_IPAQ_short
+    :param out_path: path of scored output. Written as parquet if it ends in
+                     '.parquet' (requires pyarrow), otherwise as csv.
+    :param truncate: see score_IPAQ_short
+    :param chunksize: number of rows read and scored at a time
+    :param verbose: Flag to print rows scored and throughput when finished
+    :return stats: dict with rows (number of rows scored), seconds (wall
+                   time) and rows_per_s (throughput)
+    """
+    start = time.perf_counter()
+
+    # explicit dtypes - subid as str (so every chunk gives the same ids and
+    # output schema), IPAQ items as float64
+    columns = pd.read_csv(csv_path, nrows=0).columns
+    dtypes = {col: np.float64 for col in columns[1:11]}
+    dtypes[columns[0]] = str
+
+    parquet = str(out_path).endswith('.parquet')
+    if parquet:
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+    writer = None
+    rows = 0
+    try:
+        for chunk in pd.read_csv(csv_path, dtype=dtypes, chunksize=chunksize):
+            scored = score_IPAQ_short(chunk, truncate=truncate)
+            if parquet:
+                table = pa.Table.from_pandas(scored, preserve_index=False)
+                if writer is None:
+                    writer = pq.ParquetWriter(out_path, table.schema)
+                writer.write_table(table)
+            else:
+                scored.to_csv(out_path, mode='w' if rows == 0 else 'a',
+                              header=rows == 0, index=False)
+            rows += len(scored)
+    finally:
+        if writer is not None:
+            writer.close()
+
+    seconds = time.perf_counter() - start
+    stats = {'rows': rows, 'seconds': seconds,
+             'rows_per_s': rows / seconds if seconds else float('nan')}
+    if verbose:
+        print('Scored %d rows in %.1f s (%.0f rows/s)'
+              % (rows, seconds, stats['rows_per_s']))
+
+    return stats
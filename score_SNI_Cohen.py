@@ -1,3 +1,92 @@
+import numpy as np
+import pandas as pd
+
+from instrumentation import stages
+from scoring_utils import item_block
+
+# version of the scoring rules - increase when a change alters scores (this
+# invalidates results cached by score_cache)
+SCORER_VERSION = 2
+
+# SNI items used for scoring (other SNI columns are ignored)
+SNI_ITEMS = ('SNI_1', 'SNI_2a', 'SNI_3a', 'SNI_4a', 'SNI_5a', 'SNI_6a',
+             'SNI_7a', 'SNI_8a', 'SNI_9a', 'SNI_9b', 'SNI_10', 'SNI_11',
+             'SNI_11a', 'SNI_12', 'SNI_12a_number', 'SNI_12b_number',
+             'SNI_12c_number', 'SNI_12d_number', 'SNI_12e_number',
+             'SNI_12f_number')
+
+def _columns(*items):
+    """ Positions of SNI items in the SNI_ITEMS item matrix. """
+    return [SNI_ITEMS.index(item) for item in items]
+
+_SPOUSE = SNI_ITEMS.index('SNI_1')
+_EMPLOYEE = _columns('SNI_9a', 'SNI_9b')
+_ROLES = _columns('SNI_2a', 'SNI_3a', 'SNI_4a', 'SNI_5a', 'SNI_6a', 'SNI_7a',
+                  'SNI_8a', 'SNI_10', 'SNI_11', 'SNI_12')
+_PEOPLE = _columns('SNI_2a', 'SNI_5a', 'SNI_6a', 'SNI_7a', 'SNI_8a', 'SNI_9a',
+                   'SNI_9b', 'SNI_10', 'SNI_11a', 'SNI_12a_number',
+                   'SNI_12b_number', 'SNI_12c_number', 'SNI_12d_number',
+                   'SNI_12e_number', 'SNI_12f_number')
+_PARENTS_INLAWS = _columns('SNI_3a', 'SNI_4a')
+_NETWORKS = _columns('SNI_6a', 'SNI_7a', 'SNI_8a', 'SNI_10', 'SNI_11a')
+_GROUPS = _columns('SNI_12a_number', 'SNI_12b_number', 'SNI_12c_number',
+                   'SNI_12d_number', 'SNI_12e_number', 'SNI_12f_number')
+_FAMILY = _columns('SNI_2a', 'SNI_3a', 'SNI_4a', 'SNI_5a')
+
+def _score_SNI_items(items, stage=None):
+    """
+    Scores number of high-contact roles, number of people in social network
+    and number of embedded networks in one pass over the SNI item matrix.
+
+    :param items: float64 numpy array of size p * len(SNI_ITEMS) with items
+                  in SNI_ITEMS order (missing values = NaN or 0)
+    :param stage: stage marker (see instrumentation.stages) of the caller
+    :return roles, people, networks: numpy arrays of size p
+    """
+    if stage is None:
+        stage = stages('_score_SNI_items', len(items))
+
+    # missing values count as 0, answered items are non-zero
+    items = np.where(np.isnan(items), 0.0, items)
+    answered = items != 0
+
+    # for SNI_1 (spouse) only answers = 1 should be retained as 1
+    spouse = (items[:, _SPOUSE] == 1).astype(np.float64)
+
+    #%% 1) Score Number of High-Contact Roles (Network Diversity)
+    # for employee both 9a and 9b must be non-zero (counted as 2 roles, as
+    # in previous versions of this function)
+    employee = 2 * answered[:, _EMPLOYEE].all(axis=1)
+    roles = spouse + np.count_nonzero(answered[:, _ROLES], axis=1) + employee
+    stage('roles')
+
+    #%% 2) Score Number of People in Social Network
+    # replace answers for speaking to parents + parent in laws 3a, 4a
+    # (1 -> 1, 2 -> 1, 3 -> 2)
+    parents_inlaws = items[:, _PARENTS_INLAWS]
+    parents_inlaws[parents_inlaws == 2] = 1
+    parents_inlaws[parents_inlaws == 3] = 2
+    people = (items[:, _PEOPLE].sum(axis=1) + spouse +
+              parents_inlaws.sum(axis=1))
+    stage('people')
+
+    #%% 3) Score Number of Embedded Networks
+    # assign score of 1 to networks w/ >= 4 high contact people (friends,
+    # church, school, neighbours, volunteers, work, groups)
+    networks = np.count_nonzero(items[:, _NETWORKS] >= 4, axis=1)
+    networks += items[:, _EMPLOYEE].sum(axis=1) >= 4
+    networks += items[:, _GROUPS].sum(axis=1) >= 4
+
+    # family network = at least 3 high-contact family roles AND at least 4
+    # high-contact family members
+    family_roles = np.count_nonzero(answered[:, _FAMILY], axis=1) + spouse
+    family_members = items[:, _FAMILY].sum(axis=1) + spouse
+    networks += (family_roles >= 3) & (family_members >= 4)
+    stage('networks')
+
+    # scores are float64, as in previous versions of this function
+    return roles, people, networks.astype(np.float64)
+
 def score_SNI_Cohen(df):
     """
     Scores the Social Network Index Questionnaire following the 
@@ -12,6 +101,8 @@ def score_SNI_Cohen(df):
     :param df: pandas dataframe (or .csv file) of size p * 35 (p = number of 
                 participants). Index should be subid. Cols = 35 columns 
                 containing responses to Social Network Index Questionnaire. 
+                Columns are looked up by name (see SNI_ITEMS), so df may
+                contain other columns. df is not modified.
 
     :return SNI_scored: dataframe with scored SNI data with following columns:
                     - Column 1 (subid)= participant id
@@ -19,124 +110,17 @@ def score_SNI_Cohen(df):
                     - Column 3 (SNI_People) = number of people in social network
                     - Column 4 (SNI_Networks) = number of embedded networks
     """
-    import pandas    
-    import numpy
-    
-    # test
-    df=sni.copy()
-    
-    #%% 1) Score Number of High-Contact Roles (Network Diversity)
-    # for SNI_1 (spouse) only answers = 1 should be retained as 1
-    spouse = df['SNI_1']
-    spouse = spouse.where(spouse==1)
-    spouse.replace(np.nan, 0, inplace=True)
-    
-    # get other answers for network diversity
-    net_div = df[['SNI_2a', 'SNI_3a', 'SNI_4a', 'SNI_5a', 'SNI_6a', 'SNI_7a',
-                  'SNI_8a', 'SNI_9a', 'SNI_9b', 'SNI_10', 'SNI_11', 'SNI_12']]
-    
-    # replace all non zeros with 1
-    net_div.replace(np.nan, 0, inplace=True)    
-    net_div[net_div != 0] = 1
-    
-    # for employee both 9a and 9b must = 1 to be scored as 1 overall
-    employee = net_div[['SNI_9a', 'SNI_9b']].sum(axis=1)
-    employee.replace(1, 0, inplace=True)
-    
-    # drop employee qs from other answers
-    net_div.drop(['SNI_9a', 'SNI_9b'], axis=1, inplace=True)
-    
-    # add back spouse and employee answers
-    net_div['SNI_1'] = spouse
-    net_div['SNI_9'] = employee
-    
-    #sum for total 
-    num_high_contact = net_div.sum(axis=1)
-    
-    #%% 2) Score Number of People in Social Network
-    # get answers where simple sum of numbers used
-    num_people = df[['SNI_2a', 'SNI_5a', 'SNI_6a', 'SNI_7a', 'SNI_8a', 'SNI_9a',
-                     'SNI_9b', 'SNI_10', 'SNI_11a', 'SNI_12a_number', 
-                     'SNI_12b_number', 'SNI_12c_number', 'SNI_12d_number',
-                     'SNI_12e_number', 'SNI_12f_number']]
-    
-    # add spouse where answer = 1 if married
-    num_people['SNI_1'] = spouse
-    
-    # replace answers for speaking to parents + parent in laws 3a, 4a
-    parents_inlaws = df[['SNI_3a', 'SNI_4a']]
-    parents_inlaws.replace([1, 2, 3], [1, 1, 2], inplace=True)
-    
-    num_people[['SNI_3a', 'SNI_4a']] = parents_inlaws[['SNI_3a', 'SNI_4a']]
-    
-    num_people.replace(np.nan, 0, inplace=True)
-    
-    # sum for total
-    num_people = num_people.sum(axis=1)
-    
-    #%% 3) Score Number of Embedded Networks
-    # get answers for easily scored ntwrks (friends, church, school,
-    # neighbours, volunteers)
-    ntwrks = df[['SNI_6a', 'SNI_7a', 'SNI_8a', 'SNI_10', 'SNI_11a']]
-    
-    # assign score of 1 to networks w/ >= 4 high contact people
-    ntwrks[ntwrks < 4] = 0
-    ntwrks[ntwrks >= 4] = 1
-    
-    # get score for work networks
-    work_ntwrk = df[['SNI_9a', 'SNI_9b']].sum(axis=1)
-    work_ntwrk[work_ntwrk < 4] = 0
-    work_ntwrk[work_ntwrk >= 4] = 1
-    ntwrks['SNI_9'] = work_ntwrk
-    
-    # get score for group networks    
-    groups_ntwrk = df[['SNI_12a_number', 'SNI_12b_number', 'SNI_12c_number',
-                       'SNI_12d_number', 'SNI_12e_number', 'SNI_12f_number']].sum(axis=1)
-    groups_ntwrk[groups_ntwrk < 4] = 0
-    groups_ntwrk[groups_ntwrk >= 4] = 1
-    ntwrks['SNI_12'] = groups_ntwrk
-    
-    # get score for family networks
-    
-    # count number of high-contact family roles
-    family_roles = df[['SNI_2a', 'SNI_3a', 'SNI_4a', 'SNI_5a']]
-    family_roles['SNI_1'] = spouse
-    family_roles.replace(0, np.nan, inplace=True)
-    family_roles = family_roles.count(axis=1)
-    
-    # assign 0.5 if at least 3 high-contact family roles
-    family_roles[family_roles < 3] = 0
-    family_roles[family_roles >= 3] = 0.5
-    
-    # count number of family members
-    family_members = df[['SNI_2a', 'SNI_3a', 'SNI_4a', 'SNI_5a']]
-    family_members['SNI_1'] = spouse
-    family_members = family_members.sum(axis=1)
-    
-    # assign 0.5 if at least 4 high-contact family members
-    family_members[family_members < 4] = 0
-    family_members[family_members >= 4] = 0.5
-    
-    family_ntwrk = family_roles + family_members
-    family_ntwrk.replace(0.5, 0, inplace=True)
-    
-    ntwrks['family'] = family_ntwrk
+    stage = stages('score_SNI_Cohen', len(df))
+    items = item_block(df, SNI_ITEMS)
+    stage('read')
+    roles, people, networks = _score_SNI_items(items, stage)
 
-    # sum embedded networks
-    ntwrks.replace(np.nan, 0, inplace=True)
-    num_ntwrks = ntwrks.sum(axis=1) 
-    
     #%% 4) Merge three scores and return
-    sni_scored = pd.DataFrame(index=df.index)
-    
-    sni_scored['SNI_Roles'] = num_high_contact
-    sni_scored['SNI_People'] = num_people 
-    sni_scored['SNI_Networks'] = num_ntwrks
+    sni_scored = pd.DataFrame({'SNI_Roles': roles,
+                               'SNI_People': people,
+                               'SNI_Networks': networks}, index=df.index)
     
     sni_scored.reset_index(inplace=True)
+    stage('frame')
     
     return sni_scored
-    
-
-    
-    
\ No newline at end of file
@@ -0,0 +1,193 @@
+import glob
+import hashlib
+import os
+
+import numpy as np
+import pandas as pd
+
+import score_CRIq
+import score_CSAQ_frequency
+import score_IPAQ_short
+import score_SNI_Cohen
+
+# scorer name -> (module, scoring function, function returning the subject
+# ids of the input data, True if the first output column holds subject ids)
+_SCORERS = {
+    'CRIq': (score_CRIq, score_CRIq.score_CRIq,
+             lambda data, kwargs: data[score_CRIq._CRIq_columns(
+                     data, kwargs.get('items'))['subid']], True),
+    'IPAQ': (score_IPAQ_short, score_IPAQ_short.score_IPAQ_short,
+             lambda data, kwargs: data.iloc[:, 0], True),
+    'CSAQ': (score_CSAQ_frequency, score_CSAQ_frequency.score_CSAQ_frequency,
+             lambda data, kwargs: data.index, False),
+    'SNI': (score_SNI_Cohen, score_SNI_Cohen.score_SNI_Cohen,
+            lambda data, kwargs: data.index, True),
+    }
+
+
+# the files of a cache folder are merged into one once there are more than
+# this many (one file is added per call with new or changed participants)
+_MAX_PARTS = 8
+
+
+def score_cached(scorer, data, cache_path='score_cache', **kwargs):
+    """
+    Scores questionnaire data with a persistent per-participant result cache
+    so that only new or changed participants are rescored. Cached scores are
+    stored in columnar Arrow files (requires pyarrow) keyed by a hash of the
+    subid and a hash of the participant's raw row in data. Results are kept
+    separately for each scorer version (SCORER_VERSION in the scorer's
+    module) and scorer arguments (kwargs), so a change to the scoring rules
+    or arguments rescores everyone.
+    All scorers score each participant independently of the others, so
+    scores from the cache are the same as rescoring the full data.
+
+    The cache files are memory-mapped. Hashes are compared in numpy, only
+    the cached scores of unchanged participants are read and only new or
+    changed participants are written (see benchmarks/bench_score_cache.py).
+
+    Usage:
+        scores = score_cached('CRIq', wave_1_to_5)    # scores everyone
+        scores = score_cached('CRIq', wave_1_to_6)    # scores wave 6 only
+
+    :param scorer: 'CRIq', 'IPAQ', 'CSAQ' or 'SNI'
+    :param data: input data, as for score_CRIq, score_IPAQ_short,
+                 score_CSAQ_frequency or score_SNI_Cohen. Subject ids must be
+                 unique.
+    :param cache_path: cache folder (created if needed)
+    :param kwargs: other arguments passed to the scorer (e.g. truncate=False)
+    :return scores: dataframe indexed by subid (in data order) with the
+                    score columns returned by the scorer
+    """
+    import pyarrow as pa
+
+    module, score, get_subids, subid_column = _SCORERS[scorer]
+
+    subids = pd.Index(get_subids(data, kwargs), name='subid')
+    if not subids.is_unique:
+        raise ValueError('Subject ids must be unique to use the score cache')
+    key = pd.util.hash_array(np.asarray(subids)).view(np.int64)
+    row_hash = pd.util.hash_pandas_object(
+            data, index=False).to_numpy().view(np.int64)
+
+    # one folder per scorer version and scorer arguments
+    settings = hashlib.md5(repr(sorted(kwargs.items())).encode()).hexdigest()
+    cache = _ScoreCache(os.path.join(cache_path, '%s_v%s_%s' % (
+            scorer, module.SCORER_VERSION, settings[:8])))
+    try:
+        # cache hits = same subid and same raw row
+        position = cache.lookup(key, row_hash)
+        miss = np.flatnonzero(position < 0)
+
+        if len(miss):
+            fresh = score(data.iloc[miss], **kwargs)
+            if subid_column:
+                fresh = fresh.iloc[:, 1:]
+            position[miss] = cache.append(key[miss], row_hash[miss], fresh)
+        if not len(position):
+            return pd.DataFrame(index=subids)
+
+        # every score (cached or fresh) gathered in data order in one take
+        names = cache.tables[0].column_names[2:]
+        scores = pa.concat_tables(cache.tables).select(names) \
+            .take(position).to_pandas()
+        if len(cache.tables) > _MAX_PARTS:
+            cache.compact()
+    finally:
+        cache.close()
+    scores.index = subids
+
+    return scores
+
+
+class _ScoreCache:
+    """
+    Cached scores of one scorer version and scorer arguments: a folder of
+    Arrow IPC files (part-<n>.arrow) with columns key (subid hash), row_hash
+    and the scores. A later file holds newer scores for the same key.
+    """
+
+    def __init__(self, folder):
+        import pyarrow as pa
+
+        self.folder = folder
+        self.paths = sorted(glob.glob(os.path.join(folder, 'part-*.arrow')))
+        self._maps = [pa.memory_map(path) for path in self.paths]
+        self.tables = [pa.ipc.open_file(source).read_all()
+                       for source in self._maps]
+
+        # latest row of each key over all files (positions are rows of the
+        # files concatenated in order)
+        keys = [table.column('key').to_numpy() for table in self.tables]
+        self.keys = pd.Index(np.concatenate(keys) if keys else
+                             np.empty(0, np.int64))
+        self.row_hash = np.concatenate(
+                [table.column('row_hash').to_numpy()
+                 for table in self.tables]) if keys else np.empty(0, np.int64)
+        self.latest = np.arange(len(self.keys))
+        if len(self.tables) > 1:
+            newest = ~self.keys.duplicated(keep='last')
+            self.keys = self.keys[newest]
+            self.row_hash = self.row_hash[newest]
+            self.latest = self.latest[newest]
+
+    def lookup(self, key, row_hash):
+        """ Positions of the cached scores of each key whose row hash is
+        unchanged, or -1. """
+        if not len(self.keys):
+            return np.full(len(key), -1)
+        position = self.keys.get_indexer(key)
+        hit = position >= 0
+        hit[hit] = self.row_hash[position[hit]] == row_hash[hit]
+        position = np.where(hit, self.latest[np.maximum(position, 0)], -1)
+        return position
+
+    def append(self, key, row_hash, scores):
+        """ Adds scores as a new file of the cache and returns their
+        positions. """
+        import pyarrow as pa
+
+        table = pa.Table.from_pandas(scores, preserve_index=False)
+        table = table.add_column(0, 'key', pa.array(key)) \
+            .add_column(1, 'row_hash', pa.array(row_hash)) \
+            .replace_schema_metadata(None)
+        start = sum(len(cached) for cached in self.tables)
+        self.tables.append(table)
+        self._write(table)
+        return np.arange(start, start + len(table))
+
+    def compact(self):
+        """ Merges all files of the cache into one file, keeping the latest
+        row of every key. """
+        import pyarrow as pa
+
+        merged = pa.concat_tables(self.tables)
+        keys = pd.Index(merged.column('key').to_numpy())
+        merged = merged.take(np.flatnonzero(~keys.duplicated(keep='last')))
+        old_paths = list(self.paths)
+        self._write(merged)
+        self.close()
+        for path in old_paths:
+            os.remove(path)
+
+    def _write(self, table):
+        """ Writes table as the next part-<n>.arrow file (via a temporary
+        file, so a file is never read half-written). """
+        import pyarrow as pa
+
+        number = int(os.path.basename(self.paths[-1])[5:-6]) + 1 \
+            if self.paths else 0
+        path = os.path.join(self.folder, 'part-%04d.arrow' % number)
+        os.makedirs(self.folder, exist_ok=True)
+        with pa.OSFile(path + '.tmp', 'wb') as sink, \
+                pa.ipc.new_file(sink, table.schema) as writer:
+            writer.write_table(table)
+        os.replace(path + '.tmp', path)
+        self.paths.append(path)
+
+    def close(self):
+        """ Releases the memory-mapped files. """
+        self.tables = []
+        for source in self._maps:
+            source.close()
+        self._maps = []
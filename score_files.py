@@ -0,0 +1,116 @@
+"""
+Command-line batch scoring of many per-site questionnaire files. Every file
+matching the given glob pattern(s) is scored in its own worker process and
+written to one partitioned Parquet dataset (one site=<file name> partition
+per input file, readable with pd.read_parquet(out_dir)). Per-file timing and
+row counts are printed as files finish.
+
+Usage: python score_files.py "sites/*.csv" --questionnaire CRIq --out CRIq_scored
+"""
+import argparse
+import glob
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+import pandas as pd
+
+from scoring_utils import SCORERS, read_export, score_frame
+
+
+def _site(path):
+    """ Partition name of an input file (file name without extension). """
+    return os.path.splitext(os.path.basename(path))[0]
+
+
+def score_file(path, questionnaire, out_dir, subid='subid'):
+    """
+    Scores one .csv or .parquet file and writes the scores to
+    out_dir/site=<file name>/part-0.parquet (requires pyarrow).
+
+    :param path: input file with one row per participant
+    :param questionnaire: 'CRIq', 'IPAQ', 'CSAQ' or 'SNI'
+    :param out_dir: folder of the partitioned Parquet dataset
+    :param subid: name of the subject id column
+    :return stats: dict with path, rows and seconds (wall time)
+    """
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+
+    start = time.perf_counter()
+    scored = score_frame(read_export(path), questionnaire, subid)
+
+    partition = os.path.join(out_dir, 'site=%s' % _site(path))
+    os.makedirs(partition, exist_ok=True)
+    pq.write_table(pa.Table.from_pandas(scored, preserve_index=False),
+                   os.path.join(partition, 'part-0.parquet'))
+
+    return {'path': path, 'rows': len(scored),
+            'seconds': time.perf_counter() - start}
+
+
+def score_files(patterns, questionnaire, out_dir, n_workers=None,
+                subid='subid', verbose=True):
+    """
+    Scores every .csv/.parquet file matching patterns in parallel, one file
+    per task in a process pool, into one partitioned Parquet dataset.
+
+    :param patterns: glob pattern or list of glob patterns of input files
+    :param questionnaire: 'CRIq', 'IPAQ', 'CSAQ' or 'SNI'
+    :param out_dir: folder of the partitioned Parquet dataset
+    :param n_workers: number of worker processes (default: number of CPUs)
+    :param subid: name of the subject id column
+    :param verbose: Flag to print timing and row count of each file
+    :return stats: dataframe with rows and seconds of each file (index =
+                   path), in the order files finished
+    """
+    if questionnaire not in SCORERS:
+        raise ValueError('questionnaire must be one of %s'
+                         % ', '.join(SCORERS))
+    if isinstance(patterns, str):
+        patterns = [patterns]
+    paths = sorted({path for pattern in patterns
+                    for path in glob.glob(pattern)})
+    if not paths:
+        raise FileNotFoundError('no files match %s' % ', '.join(patterns))
+    sites = [_site(path) for path in paths]
+    if len(set(sites)) != len(sites):
+        raise ValueError('input file names must be unique - they name the '
+                         'partitions of the output dataset')
+
+    start = time.perf_counter()
+    stats = []
+    with ProcessPoolExecutor(max_workers=n_workers) as pool:
+        futures = [pool.submit(score_file, path, questionnaire, out_dir,
+                               subid) for path in paths]
+        for future in as_completed(futures):
+            result = future.result()
+            stats.append(result)
+            if verbose:
+                print('%-40s %10d rows %8.2f s'
+                      % (result['path'], result['rows'], result['seconds']))
+    stats = pd.DataFrame(stats).set_index('path')
+
+    if verbose:
+        seconds = time.perf_counter() - start
+        print('Scored %d files, %d rows in %.1f s (%.0f rows/s)'
+              % (len(stats), stats['rows'].sum(), seconds,
+                 stats['rows'].sum() / seconds))
+
+    return stats
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('patterns', nargs='+',
+                        help='glob pattern(s) of .csv/.parquet site files')
+    parser.add_argument('--questionnaire', '-q', required=True,
+                        choices=sorted(SCORERS))
+    parser.add_argument('--out', required=True,
+                        help='folder of the partitioned Parquet dataset')
+    parser.add_argument('--workers', type=int, default=None)
+    parser.add_argument('--subid', default='subid')
+    args = parser.parse_args()
+
+    score_files(args.patterns, args.questionnaire, args.out,
+                n_workers=args.workers, subid=args.subid)
@@ -0,0 +1,88 @@
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+import pandas as pd
+
+from score_CRIq import CRIQ_ITEMS, score_CRIq
+from score_CSAQ_frequency import CSAQ_ITEMS, score_CSAQ_frequency
+from score_IPAQ_short import score_IPAQ_short
+from score_SNI_Cohen import SNI_ITEMS, score_SNI_Cohen
+from scoring_utils import read_export
+
+
+def score_wave(export, subid='subid', CRIq_items=None, IPAQ_columns=None,
+               n_threads=None):
+    """
+    Scores every questionnaire in one wide survey export (CRIq, IPAQ, CSAQ
+    and SNI items in one file) and returns one merged score table.
+
+    The export is parsed once: the subid and all item columns needed by the
+    scorers are converted to float64 once and held in one shared columnar
+    buffer. Each scorer reads its own columns from that buffer by name and
+    the scorers run in parallel in a thread pool (the numpy kernels release
+    the GIL), so wave processing time is bounded by the slowest scorer.
+
+    A questionnaire is scored if its columns are in the export:
+        - CRIq: columns named as in score_CRIq.CRIQ_ITEMS, or CRIq_items
+        - IPAQ: IPAQ_columns (the 10 IPAQ items, Q1 to Q7, in the order
+                expected by score_IPAQ_short)
+        - CSAQ: columns BL_CSAQ_001 to BL_CSAQ_026
+        - SNI: columns named as in score_SNI_Cohen.SNI_ITEMS
+
+    :param export: pandas dataframe, or .csv/.parquet file, with one row per
+                   participant
+    :param subid: name of subject id column in export
+    :param CRIq_items: dict mapping CRIq item names (score_CRIq.CRIQ_ITEMS,
+                       except subid) to column names in export
+    :param IPAQ_columns: list of 10 column names in export for IPAQ items
+    :param n_threads: number of scorers run at once (default = all)
+    :return scores: dataframe indexed by subid with scores from each scored
+                    questionnaire. Columns are prefixed with the questionnaire
+                    name (e.g. CRIq_total, IPAQ_totalMET, CSAQ_total,
+                    SNI_Roles).
+    """
+    export = read_export(export)
+
+    # columns needed by each questionnaire found in the export
+    if CRIq_items is None and set(CRIQ_ITEMS[1:]).issubset(export.columns):
+        CRIq_items = {item: item for item in CRIQ_ITEMS[1:]}
+    columns = {}
+    if CRIq_items is not None:
+        columns['CRIq'] = [CRIq_items[item] for item in CRIQ_ITEMS[1:]]
+    if IPAQ_columns is not None:
+        columns['IPAQ'] = list(IPAQ_columns)
+    if set(CSAQ_ITEMS).issubset(export.columns):
+        columns['CSAQ'] = list(CSAQ_ITEMS)
+    if set(SNI_ITEMS).issubset(export.columns):
+        columns['SNI'] = list(SNI_ITEMS)
+
+    # shared buffer - each needed item column converted to float64 once
+    needed = list(dict.fromkeys(col for cols in columns.values()
+                                for col in cols if col != subid))
+    buffer = pd.DataFrame({col: export[col].to_numpy(dtype=np.float64)
+                           for col in needed})
+    buffer[subid] = export[subid].to_numpy()
+
+    scorers = {
+        'CRIq': lambda: score_CRIq(buffer, items=dict(CRIq_items, subid=subid)),
+        'IPAQ': lambda: score_IPAQ_short(buffer[[subid] + columns['IPAQ']]),
+        'CSAQ': lambda: score_CSAQ_frequency(buffer),
+        'SNI': lambda: score_SNI_Cohen(buffer),
+        }
+
+    with ThreadPoolExecutor(max_workers=n_threads or max(len(columns), 1)) \
+            as pool:
+        futures = {name: pool.submit(scorers[name]) for name in columns}
+        results = {name: future.result() for name, future in futures.items()}
+
+    # merge scores - rows are in export order in every result
+    index = pd.Index(buffer[subid], name=subid)
+    for name, result in results.items():
+        result.drop(columns=['subid', 'index'], errors='ignore', inplace=True)
+        result.index = index
+        result.columns = [col if col.startswith(name + '_')
+                          else name + '_' + col for col in result.columns]
+    scores = pd.concat(list(results.values()), axis=1) if results else \
+        pd.DataFrame(index=index)
+
+    return scores
@@ -0,0 +1,87 @@
+from importlib import import_module
+
+import numpy as np
+import pandas as pd
+
+# questionnaire -> (module and name of its scoring function, True if the
+# scorer expects subid as the index of the data rather than as a column).
+# Scorers are imported on first use, as they import this module.
+SCORERS = {
+    'CRIq': ('score_CRIq', 'score_CRIq', False),
+    'IPAQ': ('score_IPAQ_short', 'score_IPAQ_short', False),
+    'CSAQ': ('score_CSAQ_frequency', 'score_CSAQ_frequency', True),
+    'SNI': ('score_SNI_Cohen', 'score_SNI_Cohen', True),
+    }
+
+
+def item_block(df, labels):
+    """
+    Pulls the named item columns of a questionnaire into one contiguous
+    float64 numpy array of size p * len(labels), one column at a time (i.e.
+    without creating an intermediate dataframe). The array is column-major so
+    each item is contiguous in memory. df is not modified.
+
+    :param df: pandas dataframe containing questionnaire responses, or a
+               pyarrow Table (null responses become NaN)
+    :param labels: list of column names in df
+    :return block: float64 numpy array
+    """
+    block = np.empty((len(labels), len(df)))
+    for j, label in enumerate(labels):
+        column = df[label]
+        if isinstance(column, pd.Series):
+            block[j] = column.to_numpy(dtype=np.float64)
+        else:
+            block[j] = column.to_numpy()
+    return block.T
+
+
+def ceil_to_multiple(values, base=5, out=None):
+    """
+    Rounds values up to the nearest multiple of base (e.g. with base=5:
+    1 -> 5, 5 -> 5, 6 -> 10, 0 -> 0), as instructed in the CRIq paper scale.
+    Works on whole numpy arrays at once and NaN values are kept as NaN.
+
+    :param values: float numpy array
+    :param base: multiple to round up to
+    :param out: array to write the result into. Pass out=values to round in
+                place without copying
+    :return out: rounded array
+    """
+    out = np.divide(values, base, out=out)
+    np.ceil(out, out=out)
+    np.multiply(out, base, out=out)
+    return out
+
+
+def read_export(export):
+    """
+    Reads a survey export from a dataframe, or from a .csv or .parquet file.
+    """
+    if isinstance(export, pd.DataFrame):
+        return export
+    if str(export).endswith('.parquet'):
+        return pd.read_parquet(export)
+    return pd.read_csv(export)
+
+
+def score_frame(data, questionnaire, subid='subid'):
+    """
+    Scores one dataframe with the scorer of questionnaire, moving subid
+    between the index and the columns as that scorer expects.
+
+    :param data: pandas dataframe with one row per participant
+    :param questionnaire: 'CRIq', 'IPAQ', 'CSAQ' or 'SNI'
+    :param subid: name of the subject id column
+    :return scored: dataframe of scores with subid as a column
+    """
+    module, name, subid_as_index = SCORERS[questionnaire]
+    scorer = getattr(import_module(module), name)
+    if subid_as_index and subid in data.columns:
+        data = data.set_index(subid)
+    elif not subid_as_index and data.index.name == subid:
+        data = data.reset_index()
+    scored = scorer(data)
+    if scored.index.name is not None:
+        scored = scored.reset_index()
+    return scored